@@ -0,0 +1,271 @@
+"""Adaptive quality control for the remote stream.
+
+Receivers periodically report how the stream is doing (see
+`frame_protocol.pack_feedback`). `QualityController` turns those reports
+into JPEG quality, resolution scale and frame rate settings that keep the
+queueing delay near a target: it steps down a ladder of settings quickly
+when delay or drops build up, and climbs back slowly once the link has
+headroom again.
+
+Running this module simulates a bandwidth-limited link to check how the
+controller converges:
+
+    python adaptive_quality.py --bandwidth 1.5e6 --seconds 30
+"""
+import argparse
+import time
+from collections import deque, namedtuple
+
+import cv2
+
+from frame_protocol import Feedback
+
+QualitySettings = namedtuple("QualitySettings", ["quality", "scale", "fps"])
+
+# Best to worst. Quality goes first, then resolution, then frame rate.
+LADDER = (
+    QualitySettings(85, 1.0, 30),
+    QualitySettings(75, 1.0, 30),
+    QualitySettings(65, 1.0, 30),
+    QualitySettings(65, 0.75, 30),
+    QualitySettings(55, 0.75, 30),
+    QualitySettings(55, 0.5, 30),
+    QualitySettings(50, 0.5, 20),
+    QualitySettings(45, 0.5, 15),
+    QualitySettings(40, 0.35, 15),
+    QualitySettings(40, 0.35, 10),
+    QualitySettings(35, 0.25, 10),
+    QualitySettings(30, 0.25, 5),
+)
+
+
+def capped_ladder(quality, ladder=LADDER):
+    """Returns `ladder` starting at JPEG `quality`, so adapting never raises quality above what was asked for."""
+    steps = [ladder[0]._replace(quality=quality)]
+    for settings in ladder[1:]:
+        settings = settings._replace(quality=min(settings.quality, quality))
+        if settings != steps[-1]:
+            steps.append(settings)
+    return tuple(steps)
+
+
+class QualityController:
+    """Chooses stream settings from receiver feedback."""
+
+    def __init__(self, target_delay=0.15, ladder=LADDER, start=0, up_after=3, max_hold=48):
+        self.target_delay = target_delay
+        self.ladder = ladder
+        self.level = start
+        self.up_after = up_after
+        self.max_hold = max_hold
+        self._good_reports = 0
+        self._cooldown = 0
+        # Good reports needed before climbing to a level; doubled each time a probe of it fails
+        self._hold = [up_after] * len(ladder)
+        self._probed_level = None
+        self._reports_since_up = 0
+        self._recent_delays = deque(maxlen=4)
+
+    @property
+    def settings(self):
+        return self.ladder[self.level]
+
+    def update(self, feedback):
+        """Applies one feedback report and returns the new QualitySettings."""
+        self._recent_delays.append(feedback.delay)
+        delays = list(self._recent_delays)
+        # A queue that keeps growing will hit the target soon; back off before it does
+        rising = (len(delays) == self._recent_delays.maxlen and feedback.delay > 0.1 * self.target_delay
+                  and all(a < b for a, b in zip(delays, delays[1:])))
+        congested = feedback.delay > self.target_delay or feedback.dropped > 0 or rising
+        self._reports_since_up += 1
+        if congested:
+            self._good_reports = 0
+            if self._probed_level is not None and self._reports_since_up <= 2:
+                # The last step up did not fit the link; wait longer before trying it again
+                self._hold[self._probed_level] = min(self.max_hold, 2 * self._hold[self._probed_level])
+                self._probed_level = None
+            if self._cooldown > 0:
+                # Give the link a report to drain after the last step down
+                self._cooldown -= 1
+                return self.settings
+            step = 2 if feedback.delay > 2 * self.target_delay else 1
+            self.level = min(len(self.ladder) - 1, self.level + step)
+            self._cooldown = 1
+            self._recent_delays.clear()
+            return self.settings
+
+        self._cooldown = 0
+        if feedback.delay < 0.5 * self.target_delay:
+            self._good_reports += 1
+            if self.level > 0 and self._good_reports >= self._hold[self.level - 1]:
+                self.level -= 1
+                self._good_reports = 0
+                self._probed_level = self.level
+                self._reports_since_up = 0
+        else:
+            self._good_reports = 0
+        return self.settings
+
+
+class FeedbackTracker:
+    """Receiver-side bookkeeping that produces periodic Feedback reports.
+
+    Sender and receiver clocks are not synchronised, so queueing delay is
+    measured as transit time above the smallest transit time seen over the
+    last few reports rather than as absolute latency.
+    """
+
+    def __init__(self, interval=1.0, base_reports=10):
+        self.interval = interval
+        self._base_mins = deque(maxlen=base_reports)
+        self._window_min = None
+        self._window_max = None
+        self._received = 0
+        self._dropped = 0
+        self._started = None
+
+    def on_frame(self, capture_timestamp, now=None):
+        """Records a received frame by its sender-side capture time."""
+        now = time.time() if now is None else now
+        if self._started is None:
+            self._started = now
+        transit = now - capture_timestamp
+        self._window_min = transit if self._window_min is None else min(self._window_min, transit)
+        self._window_max = transit if self._window_max is None else max(self._window_max, transit)
+        self._received += 1
+
+    def on_dropped(self, count=1):
+        self._dropped += count
+
+    def report(self, now=None):
+        """Returns a Feedback once per interval, otherwise None."""
+        now = time.time() if now is None else now
+        if self._started is None or now - self._started < self.interval:
+            return None
+        elapsed = now - self._started
+        delay = elapsed  # nothing arrived at all: treat the silence as delay
+        if self._window_min is not None:
+            self._base_mins.append(self._window_min)
+            delay = max(0.0, self._window_max - min(self._base_mins))
+        feedback = Feedback(self._received / elapsed, delay, self._dropped, self._received)
+        self._window_min = self._window_max = None
+        self._received = self._dropped = 0
+        self._started = now
+        return feedback
+
+
+def apply_scale(frame, scale):
+    """Downscales a frame for sending; returns it unchanged at scale 1."""
+    if scale >= 1.0:
+        return frame
+    h, w = frame.shape[:2]
+    return cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+class SimulatedLink:
+    """A bandwidth-limited link behind a bounded send buffer, for exercising the controller offline.
+
+    Like a TCP socket with a small send buffer, a frame that does not fit
+    in the buffer is not queued; the sender has to skip it.
+    """
+
+    def __init__(self, bandwidth_bps, buffer_bytes=64 * 1024, base_delay=0.005):
+        self.bandwidth = bandwidth_bps / 8.0  # bytes per second
+        self.buffer_bytes = buffer_bytes
+        self.base_delay = base_delay
+        self._free_at = 0.0
+
+    def queued_bytes(self, now):
+        return max(0.0, self._free_at - now) * self.bandwidth
+
+    def send(self, size, now):
+        """Returns the arrival time of a `size`-byte frame sent at `now`, or None if it was skipped."""
+        if self.queued_bytes(now) > 0 and self.queued_bytes(now) + size > self.buffer_bytes:
+            return None
+        start = max(now, self._free_at)
+        self._free_at = start + size / self.bandwidth
+        return self._free_at + self.base_delay
+
+
+def simulate(controller, bandwidth_bps, seconds=30.0, capture_fps=30.0, report_interval=1.0,
+             frame_size=None, link=None):
+    """Drives `controller` over a SimulatedLink and returns one row per feedback report.
+
+    `frame_size(settings)` returns encoded bytes per frame; by default the
+    synthetic test pattern is really encoded at each setting.
+    """
+    if frame_size is None:
+        frame_size = encoded_size_probe()
+    if link is None:
+        link = SimulatedLink(bandwidth_bps)
+    interval = 1.0 / capture_fps
+    history = []
+    next_send = 0.0
+    next_report = report_interval
+    delays = []
+    received = 0
+    dropped = 0
+    min_latency = None
+
+    for tick in range(int(seconds * capture_fps)):
+        t = tick * interval
+        settings = controller.settings
+        if t + 1e-9 >= next_send:
+            next_send = max(next_send + 1.0 / settings.fps, t)
+            arrival = link.send(frame_size(settings), t)
+            if arrival is None:
+                dropped += 1
+            else:
+                # Queueing delay is latency above the best latency seen, as a receiver would measure it
+                latency = arrival - t
+                min_latency = latency if min_latency is None else min(min_latency, latency)
+                delays.append(latency - min_latency)
+                received += 1
+
+        if t + interval >= next_report:
+            delay = max(delays) if delays else 0.0
+            feedback = Feedback(received / report_interval, delay, dropped, received)
+            history.append((round(next_report, 2), settings, feedback))
+            controller.update(feedback)
+            delays = []
+            received = 0
+            dropped = 0
+            next_report += report_interval
+    return history
+
+
+def encoded_size_probe(width=640, height=480):
+    """Returns a cached function measuring JPEG size of the test pattern per setting."""
+    from capture_engine import synthetic_frame
+
+    frame = synthetic_frame(0, width, height)
+    cache = {}
+
+    def frame_size(settings):
+        key = (settings.quality, settings.scale)
+        if key not in cache:
+            ok, buf = cv2.imencode(".jpg", apply_scale(frame, settings.scale),
+                                   [cv2.IMWRITE_JPEG_QUALITY, settings.quality])
+            cache[key] = len(buf)
+        return cache[key]
+    return frame_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the adaptive quality controller.")
+    parser.add_argument("--bandwidth", type=float, default=1.5e6, help="link bandwidth in bits/s")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--target-delay", type=float, default=0.15)
+    args = parser.parse_args()
+
+    controller = QualityController(args.target_delay)
+    for t, settings, feedback in simulate(controller, args.bandwidth, args.seconds):
+        print(f"t={t:5.1f}s  quality={settings.quality:2d} scale={settings.scale:.2f} "
+              f"fps={settings.fps:2d}  achieved={feedback.fps:4.1f} fps  "
+              f"delay={feedback.delay * 1000:6.1f} ms  dropped={feedback.dropped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Benchmark harness for the streaming app, no camera or second machine needed.
+
+Drives a real `StreamingApp` on the offscreen Qt platform. The local
+scenario feeds its camera tiles from `SyntheticCapture`. The remote
+scenarios connect the remote dock to a `StreamServer` on loopback that
+serves the same test pattern over TCP or UDP. Each scenario reports frames
+per second, bytes per frame, display latency percentiles, per-stage timings
+and CPU time per thread group, and the results are saved as JSON:
+
+    python benchmark.py --width 1280 --height 720 --fps 30 --duration 10
+    python benchmark.py --compare benchmarks/bench_20241114-150000.json
+"""
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import asyncio
+import functools
+import gc
+import json
+import platform
+import sys
+import threading
+import time
+
+import cv2
+from PySide6.QtCore import QEvent, QEventLoop, Qt, QTimer
+from PySide6.QtWidgets import QApplication
+
+import frame_protocol
+from capture_engine import CaptureEngine, SyntheticCapture
+from stream_final import StreamingApp
+from stream_server import StreamServer
+
+SCENARIOS = ("local", "tcp", "udp")
+
+
+def thread_cpu_times():
+    """Returns {native thread id: CPU seconds} for this process; empty where /proc is missing."""
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    times = {}
+    try:
+        tids = os.listdir("/proc/self/task")
+    except OSError:
+        return times
+    for tid in tids:
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                # Fields after the parenthesised thread name; utime and stime are 14th and 15th
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        times[int(tid)] = (int(fields[11]) + int(fields[12])) / ticks
+    return times
+
+
+def thread_group(name):
+    """Maps a thread name onto the pipeline stage it belongs to."""
+    for prefix, group in (("MainThread", "gui"), ("capture-", "capture"), ("bench-server", "server"),
+                          ("asyncio", "server-encode"), ("snapshot", "snapshot"),
+                          ("recorder", "recorder"), ("probe", "scan"), ("device-scan", "scan")):
+        if name.startswith(prefix):
+            return group
+    return "other"
+
+
+class CpuSampler:
+    """Measures CPU time per thread group between `start` and `stop`."""
+
+    def __init__(self, extra_threads=None):
+        self.extra_threads = extra_threads or (lambda: {})  # {native id: group} for non-Python threads
+
+    def start(self):
+        self._wall = time.perf_counter()
+        self._process = time.process_time()
+        self._threads = thread_cpu_times()
+
+    def stop(self):
+        """Returns (process CPU seconds, wall seconds, {group: CPU seconds})."""
+        threads = thread_cpu_times()
+        wall = time.perf_counter() - self._wall
+        process = time.process_time() - self._process
+        groups = {thread.native_id: thread_group(thread.name) for thread in threading.enumerate()}
+        groups.update(self.extra_threads())
+        per_group = {}
+        for tid, seconds in threads.items():
+            group = groups.get(tid, "other")
+            per_group[group] = per_group.get(group, 0.0) + seconds - self._threads.get(tid, 0.0)
+        return process, wall, per_group
+
+
+class LoopbackServer:
+    """Runs a StreamServer with a synthetic camera on 127.0.0.1 in a background thread."""
+
+    def __init__(self, width, height, fps, codec, quality, adaptive=False):
+        self.engine = CaptureEngine(0, width=width, height=height, fps=fps,
+                                    capture_factory=SyntheticCapture, stream_name="server")
+        self.server = StreamServer(self.engine, "127.0.0.1", 0, codec, quality, adaptive=adaptive)
+        self.engine.metrics = self.server.metrics
+        self._ready = threading.Event()
+        self._loop = None
+        self._stop = None
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()),
+                                        name="bench-server", daemon=True)
+
+    @property
+    def port(self):
+        return self.server.port
+
+    def start(self):
+        self.engine.start()
+        self._thread.start()
+        self._ready.wait(5.0)
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(5.0)
+        self.engine.stop()
+
+    def traffic(self):
+        """Returns (frames, bytes) sent to the clients connected right now."""
+        sessions = list(self.server.clients)
+        return sum(s.frames_sent for s in sessions), sum(s.bytes_sent for s in sessions)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        await self.server.start()
+        self._ready.set()
+        try:
+            await self._stop.wait()
+        finally:
+            await self.server.stop()
+
+
+def close_window(window):
+    """Closes a window and deletes it and the widgets it leaves behind while Qt is still up.
+
+    The caller must then drop its own reference and run gc.collect(), so the
+    Python side isn't torn down during interpreter shutdown.
+    """
+    window.close()
+    window.deleteLater()
+    QApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    QApplication.processEvents()
+
+
+def run_event_loop(seconds):
+    """Lets Qt process events, timers included, for `seconds`."""
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    loop.exec()
+
+
+def stage_counts(snapshot, stream):
+    return {stage: stats["count"] for stage, stats in snapshot.get(stream, {}).get("stages", {}).items()}
+
+
+def summarize(name, stream, warm, end, cpu, frame_bytes, server_metrics=None):
+    """Builds the result entry for one scenario from metrics snapshots taken after warm-up and at the end."""
+    process, wall, per_group = cpu
+    stats = end.get(stream, {"stages": {}})
+    frames = stats["stages"].get("latency", {}).get("count", 0) - stage_counts(warm, stream).get("latency", 0)
+    frames = max(frames, 1)
+    latency = stats["stages"].get("latency", {})
+    result = {
+        "frames": frames,
+        "fps": round(frames / wall, 2),
+        "bytes_per_frame": round(frame_bytes, 1),
+        "latency_ms": {key[:-3]: latency.get(key, 0.0) for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms")},
+        "stages_ms": {stage: {key[:-3]: value for key, value in s.items() if key.endswith("_ms")}
+                      for stage, s in stats["stages"].items()},
+        "cpu": {
+            "process_percent": round(100 * process / wall, 1),
+            "ms_per_frame": round(1000 * process / frames, 3),
+            "groups_ms_per_frame": {group: round(1000 * seconds / frames, 3)
+                                    for group, seconds in sorted(per_group.items()) if seconds > 0},
+        },
+    }
+    if server_metrics is not None:
+        result["server_stages_ms"] = {stage: {key[:-3]: value for key, value in s.items() if key.endswith("_ms")}
+                                      for stage, s in server_metrics.get("server", {}).get("stages", {}).items()}
+    print(f"{name:>6}: {result['fps']:6.1f} fps  {result['bytes_per_frame'] / 1024:8.1f} KiB/frame  "
+          f"latency p50 {result['latency_ms']['p50']:6.1f} p95 {result['latency_ms']['p95']:6.1f} ms  "
+          f"CPU {result['cpu']['process_percent']:5.1f}% ({result['cpu']['ms_per_frame']:.2f} ms/frame)")
+    return result
+
+
+def bench_local(args):
+    """Shows the synthetic camera in the local mosaic."""
+    factory = functools.partial(SyntheticCapture, fps=args.fps)
+    window = StreamingApp(capture_factory=factory, capture_size=(args.width, args.height))
+    window.resize(1280, 800)
+    window.show()
+    # Wait for the background device scan, then stream camera 0 only
+    deadline = time.monotonic() + 5.0
+    while window.device_scanner.devices is None and time.monotonic() < deadline:
+        run_event_loop(0.05)
+    for row in range(window.device_list.count()):
+        item = window.device_list.item(row)
+        if item.data(Qt.UserRole) is not None:
+            item.setCheckState(Qt.Checked if item.data(Qt.UserRole) == 0 else Qt.Unchecked)
+    window.start_usb_stream()
+    try:
+        # Local frames are shown uncompressed
+        return measure(window, "local", "cam0", args, lambda: args.width * args.height * 3)
+    finally:
+        close_window(window)
+        del window
+        gc.collect()
+
+
+def bench_remote(args, udp):
+    """Shows a loopback server's stream in the remote dock."""
+    server = LoopbackServer(args.width, args.height, args.fps, frame_protocol.CODEC_NAMES[args.codec],
+                            args.quality, args.adaptive)
+    server.start()
+    window = StreamingApp(capture_factory=SyntheticCapture)
+    window.resize(1280, 800)
+    window.show()
+    window.remote_ip_input.setText(f"127.0.0.1:{server.port}")
+    window.remote_udp_checkbox.setChecked(udp)
+    window.start_remote_stream()
+    try:
+        traffic = {}
+
+        def frame_bytes():
+            frames, sent = server.traffic()
+            frames -= traffic["frames"]
+            return (sent - traffic["bytes"]) / frames if frames else 0.0
+
+        def mark():
+            traffic["frames"], traffic["bytes"] = server.traffic()
+
+        return measure(window, "udp" if udp else "tcp", "remote", args, frame_bytes, mark, server)
+    finally:
+        close_window(window)
+        del window
+        gc.collect()
+        server.stop()
+
+
+def measure(window, name, stream, args, frame_bytes, on_warm=None, server=None):
+    """Warms up, then measures one scenario for args.duration seconds."""
+    def receiver_thread():
+        receiver = window.remote_receiver
+        return {receiver.native_id: "receiver"} if receiver is not None and receiver.native_id else {}
+
+    run_event_loop(args.warmup)
+    warm = window.metrics.snapshot()
+    if on_warm is not None:
+        on_warm()
+    sampler = CpuSampler(receiver_thread)
+    sampler.start()
+    run_event_loop(args.duration)
+    cpu = sampler.stop()
+    end = window.metrics.snapshot()
+    return summarize(name, stream, warm, end, cpu, frame_bytes(),
+                     server.server.metrics.snapshot() if server is not None else None)
+
+
+def compare(results, baseline_path):
+    """Prints how each scenario moved against a saved run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path}:")
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        for label, new_value, old_value in (
+                ("fps", result["fps"], old["fps"]),
+                ("latency p95 ms", result["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+                ("CPU ms/frame", result["cpu"]["ms_per_frame"], old["cpu"]["ms_per_frame"]),
+                ("bytes/frame", result["bytes_per_frame"], old["bytes_per_frame"])):
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            print(f"{name:>6} {label:<15} {old_value:10.2f} -> {new_value:10.2f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming app headlessly.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--duration", type=float, default=5.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--codec", choices=sorted(frame_protocol.CODEC_NAMES), default="jpeg")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--adaptive", action="store_true", help="let the server adapt quality to feedback")
+    parser.add_argument("--output", help="JSON file for the results (default: benchmarks/bench_<time>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = {
+        "timestamp": time.time(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "config": {key: getattr(args, key) for key in
+                   ("width", "height", "fps", "duration", "warmup", "codec", "quality", "adaptive")},
+        "scenarios": {},
+    }
+    for name in scenarios:
+        if name == "local":
+            results["scenarios"][name] = bench_local(args)
+        else:
+            results["scenarios"][name] = bench_remote(args, udp=name == "udp")
+        app.processEvents()
+
+    output = args.output
+    if output is None:
+        os.makedirs("benchmarks", exist_ok=True)
+        output = f"benchmarks/bench_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved: {output}")
+    if args.compare:
+        compare(results, args.compare)
+    app.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Threaded camera capture shared by display, recording and snapshots.
+
+`CaptureEngine` owns a `cv2.VideoCapture` and reads it on its own thread at
+the device's native rate. Every frame is stamped and pushed into a small
+ring buffer; consumers poll `latest()` or walk `frames_since()` without ever
+blocking on the camera.
+
+`DeviceScanner` finds the cameras that can be opened, probing them in
+parallel on a background thread and caching the result.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+CapturedFrame = namedtuple("CapturedFrame", ["seq", "timestamp", "frame"])
+
+
+class CaptureEngine:
+    """Grabs frames from one camera on a background thread."""
+
+    def __init__(self, device=0, width=None, height=None, fps=None,
+                 fourcc="MJPG", buffer_frames=8, max_failures=30,
+                 capture_factory=cv2.VideoCapture, metrics=None, stream_name="local"):
+        self.device = device
+        self.capture_factory = capture_factory
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.max_failures = max_failures
+        self.metrics = metrics  # optional StreamMetrics
+        self.stream_name = stream_name
+        self.capture = None
+        self.frames_captured = 0
+        self.first_frame_time = None  # wall-clock time of the first frame, for startup reports
+        self.error = None
+
+        self._buffer = deque(maxlen=buffer_frames)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._next_seq = 0
+
+    def open(self):
+        """Opens and configures the device. Returns False if it can't be opened."""
+        self.capture = self.capture_factory(self.device)
+        if not self.capture.isOpened():
+            self.capture.release()
+            self.capture = None
+            return False
+
+        if self.fourcc:
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        if self.width and self.height:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+        # Keep the driver queue short so we always see the newest frame
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return True
+
+    def start(self, background_open=False):
+        """Starts the capture thread, opening the device first if needed.
+
+        With `background_open` the device is opened on the capture thread so a
+        slow driver never blocks the caller; a failed open then ends the
+        thread and sets `error`.
+        """
+        if self.capture is None and not background_open and not self.open():
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.device}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=2.0):
+        """Stops the capture thread and releases the device.
+
+        The capture thread releases the device itself, so if it is stuck in a
+        slow read it finishes in the background after `timeout`.
+        """
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        elif self.capture:
+            self.capture.release()
+            self.capture = None
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def is_running(self):
+        return self._running and self._thread is not None and self._thread.is_alive()
+
+    @property
+    def frame_size(self):
+        """Returns the (width, height) of captured frames."""
+        latest = self.latest()
+        if latest is not None:
+            h, w = latest.frame.shape[:2]
+            return w, h
+        if self.capture:
+            return (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return 0, 0
+
+    def _run(self):
+        if self.capture is None and not self.open():
+            self.error = f"Failed to open camera {self.device}"
+            self._running = False
+            with self._cond:
+                self._cond.notify_all()
+            return
+
+        failures = 0
+        while self._running:
+            started = time.perf_counter()
+            ret, frame = self.capture.read()
+            timestamp = time.time()
+            if self.metrics is not None:
+                self.metrics.record(self.stream_name, "capture", time.perf_counter() - started)
+            if not ret:
+                failures += 1
+                if failures >= self.max_failures:
+                    self.error = f"Camera {self.device} stopped delivering frames"
+                    self._running = False
+                    break
+                time.sleep(0.01)
+                continue
+            failures = 0
+
+            if self.first_frame_time is None:
+                self.first_frame_time = timestamp
+            with self._cond:
+                self._buffer.append(CapturedFrame(self._next_seq, timestamp, frame))
+                self._next_seq += 1
+                self.frames_captured += 1
+                self._cond.notify_all()
+
+        self.capture.release()
+        self.capture = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def latest(self):
+        """Returns the newest CapturedFrame, or None before the first frame."""
+        with self._cond:
+            return self._buffer[-1] if self._buffer else None
+
+    def frames_since(self, seq):
+        """Returns the buffered frames with a sequence number greater than `seq`."""
+        with self._cond:
+            return [entry for entry in self._buffer if entry.seq > seq]
+
+    def wait_for_frame(self, after_seq=-1, timeout=1.0):
+        """Blocks until a frame newer than `after_seq` is available."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: (self._buffer and self._buffer[-1].seq > after_seq) or not self._running,
+                timeout)
+            if self._buffer and self._buffer[-1].seq > after_seq:
+                return self._buffer[-1]
+            return None
+
+    def measured_fps(self):
+        """Estimates the capture rate from the timestamps in the ring buffer."""
+        with self._cond:
+            if len(self._buffer) < 2:
+                return 0.0
+            span = self._buffer[-1].timestamp - self._buffer[0].timestamp
+            count = len(self._buffer) - 1
+        return count / span if span > 0 else 0.0
+
+
+def probe_devices(max_index=8, skip=(), capture_factory=cv2.VideoCapture):
+    """Returns {index: (width, height)} for every device below `max_index` that opens.
+
+    Devices are probed in parallel so one slow driver doesn't delay the
+    rest. Indices in `skip`, e.g. cameras that are already streaming, are
+    not touched.
+    """
+    def probe(index):
+        try:
+            capture = capture_factory(index)
+        except cv2.error:
+            return None
+        try:
+            if not capture.isOpened():
+                return None
+            return (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        finally:
+            capture.release()
+
+    indices = [index for index in range(max_index) if index not in skip]
+    if not indices:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(indices), thread_name_prefix="probe") as pool:
+        sizes = list(pool.map(probe, indices))
+    return {index: size for index, size in zip(indices, sizes) if size is not None}
+
+
+class DeviceScanner:
+    """Caches the available cameras and refreshes the list on a background thread."""
+
+    def __init__(self, max_index=8, capture_factory=cv2.VideoCapture):
+        self.max_index = max_index
+        self.capture_factory = capture_factory
+        self.devices = None  # {index: (width, height)} from the last finished scan
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def scanning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def scan(self, callback=None, in_use=()):
+        """Starts a rescan. Returns False if one is already running.
+
+        `callback(devices)` is called on the scan thread when it finishes.
+        Devices in `in_use` are not reopened and keep their cached entry.
+        """
+        with self._lock:
+            if self.scanning:
+                return False
+            self._thread = threading.Thread(target=self._scan, args=(callback, tuple(in_use)),
+                                            name="device-scan", daemon=True)
+            self._thread.start()
+        return True
+
+    def _scan(self, callback, in_use):
+        found = probe_devices(self.max_index, in_use, self.capture_factory)
+        cached = self.devices or {}
+        for index in in_use:
+            found[index] = cached.get(index, (0, 0))
+        self.devices = dict(sorted(found.items()))
+        if callback is not None:
+            callback(self.devices)
+
+
+def synthetic_frame(index, width=640, height=480):
+    """Generates a moving test pattern so the pipeline can run without a camera."""
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    frame[:, :, 0] = np.arange(width, dtype=np.uint32)[None, :] * 255 // max(width - 1, 1)
+    frame[:, :, 1] = np.arange(height, dtype=np.uint32)[:, None] * 255 // max(height - 1, 1)
+    x = (index * 8) % width
+    cv2.rectangle(frame, (x, height // 3), (x + 60, height // 3 + 60), (255, 255, 255), -1)
+    cv2.putText(frame, f"#{index}", (10, height - 20),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    return frame
+
+
+class SyntheticCapture:
+    """Stand-in for cv2.VideoCapture that produces a paced test pattern."""
+
+    def __init__(self, device=0, width=640, height=480, fps=30.0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.index = 0
+        self._opened = True
+        self._next_frame = time.monotonic()
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+        else:
+            return False
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        if self.fps:
+            self._next_frame += 1.0 / self.fps
+            delay = self._next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self._next_frame = time.monotonic()
+        frame = synthetic_frame(self.index, self.width, self.height)
+        self.index += 1
+        return True, frame
+
+    def release(self):
+        self._opened = False
@@ -0,0 +1,70 @@
+"""Sender-side gate that skips frames while the scene is not changing.
+
+Each frame is shrunk to a small grayscale thumbnail and compared with the
+thumbnail of the last frame that was actually sent. A frame only goes out
+when enough of the thumbnail has changed, or when nothing has been sent for
+a keep-alive interval, so a parked rover costs almost no bandwidth or
+encoding time. Receivers simply keep showing the last frame they got.
+
+The keep-alive should stay well below the receivers' one second feedback
+interval: a report without any frames reads as a stalled link.
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+class ChangeGate:
+    """Decides which frames are worth sending by comparing thumbnails."""
+
+    def __init__(self, threshold=0.005, pixel_delta=10, keepalive=0.5, thumb_size=(64, 48)):
+        self.threshold = threshold      # fraction of thumbnail pixels that must change; 0 sends everything
+        self.pixel_delta = pixel_delta  # grey levels a pixel must move to count as changed, above sensor noise
+        self.keepalive = keepalive
+        self.thumb_size = thumb_size
+        self.frames_seen = 0
+        self.frames_suppressed = 0
+
+        w, h = thumb_size
+        self._thumb = np.empty((h, w, 3), dtype=np.uint8)
+        self._gray = np.empty((h, w), dtype=np.uint8)
+        self._reference = np.empty((h, w), dtype=np.uint8)
+        self._diff = np.empty((h, w), dtype=np.uint8)
+        self._last_sent = None
+
+    @property
+    def suppressed_fraction(self):
+        return self.frames_suppressed / self.frames_seen if self.frames_seen else 0.0
+
+    def reset(self):
+        """Lets the next frame through, e.g. when a new receiver connects."""
+        self._last_sent = None
+
+    def check(self, frame, now=None):
+        """Returns True if `frame` should be sent. Sent frames become the new reference."""
+        now = time.monotonic() if now is None else now
+        self.frames_seen += 1
+        if self.threshold <= 0:
+            return True
+
+        if frame.ndim == 2:
+            cv2.resize(frame, self.thumb_size, dst=self._gray, interpolation=cv2.INTER_AREA)
+        else:
+            cv2.resize(frame, self.thumb_size, dst=self._thumb, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self._thumb, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+        if self._last_sent is not None and now - self._last_sent < self.keepalive:
+            cv2.absdiff(self._gray, self._reference, dst=self._diff)
+            changed = np.count_nonzero(self._diff > self.pixel_delta) / self._diff.size
+            if changed < self.threshold:
+                self.frames_suppressed += 1
+                return False
+
+        self._gray, self._reference = self._reference, self._gray
+        self._last_sent = now
+        return True
+
+    def summary(self):
+        return (f"{self.frames_suppressed} of {self.frames_seen} frames suppressed "
+                f"({self.suppressed_fraction:.0%})")
@@ -1,93 +1,582 @@
-import cv2
-import mediapipe as mp
-import RPi.GPIO as GPIO
 import time
 
+_MODULE_START = time.perf_counter()  # startup milestones count from here when /proc is missing
+
+import argparse
+import cv2
+import numpy as np
+import os
+import threading
+from collections import namedtuple
+
+import frame_protocol
+from capture_engine import CaptureEngine, CapturedFrame
+from frame_queue import DropOldestQueue
+from led_driver import LedDriver, RecordingBackend, RPiBackend
+from stream_metrics import StreamMetrics
+
+# mediapipe and the stream server are imported where they are first needed,
+# so they load while the camera opens instead of before anything else
+
+_IMPORTS_DONE = time.perf_counter()
+
 # LED GPIO Pins (Adjust as needed)
 LED_PINS = [17, 18, 27, 22, 23]  # GPIO17, GPIO18, GPIO27, GPIO22, GPIO23
 
-# Raspberry Pi GPIO Setup
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(LED_PINS, GPIO.OUT)
-
 class HandTracker:
-    def __init__(self, maxHands=2, detectionCon=0.7, trackCon=0.7):
+    def __init__(self, maxHands=2, detectionCon=0.7, trackCon=0.7,
+                 detectEvery=0, roiPadding=0.5, roiSize=192, staticImage=False):
+        """With detectEvery > 0 a full-frame detection only runs every detectEvery frames or
+        when a hand is lost; the frames in between process a padded crop around the hands,
+        scaled to roiSize x roiSize pixels. staticImage treats every frame on its own, so
+        results don't depend on the frames before it."""
+        import mediapipe as mp
         self.mpHands = mp.solutions.hands
-        self.hands = self.mpHands.Hands(max_num_hands=maxHands,
+        # Sparse full-frame detections can't rely on tracking from the previous call
+        self.hands = self.mpHands.Hands(static_image_mode=staticImage or detectEvery > 0,
+                                        max_num_hands=maxHands,
                                         min_detection_confidence=detectionCon,
                                         min_tracking_confidence=trackCon)
+        self.roiHands = None
+        if detectEvery > 0:
+            self.roiHands = self.mpHands.Hands(max_num_hands=maxHands,
+                                               min_detection_confidence=detectionCon,
+                                               min_tracking_confidence=trackCon)
         self.mpDraw = mp.solutions.drawing_utils
         self.tipIds = [4, 8, 12, 16, 20]  # Thumb & Fingers
 
+        # Pixel (x, y, z) of every landmark, reused for each frame; only the first numHands are valid
+        self.landmarks = np.zeros((maxHands, 21, 3), dtype=np.float32)
+        self.handedness = [None] * maxHands
+        self.numHands = 0
+        self.results = None
+
+        self.detectEvery = detectEvery
+        self.roiPadding = roiPadding  # margin around the hands, as a fraction of their size
+        self.roiSize = roiSize
+        self.roi = None  # (x, y, side) of the next crop in frame pixels
+        self.handCount = 0
+        self.framesSinceDetect = 0
+        self.fullDetections = 0
+        self.roiFrames = 0
+
+    def warmUp(self, width=640, height=480):
+        """Runs each model once on a blank frame so the first real frame doesn't pay for graph setup."""
+        blank = np.zeros((height, width, 3), dtype=np.uint8)
+        self.hands.process(blank)
+        if self.roiHands is not None:
+            self.roiHands.process(np.zeros((self.roiSize, self.roiSize, 3), dtype=np.uint8))
+
     def findHands(self, frame, draw=True):
-        imgRGB = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        self.results = self.hands.process(imgRGB)
-        if self.results.multi_hand_landmarks and draw:
-            for handLms in self.results.multi_hand_landmarks:
-                self.mpDraw.draw_landmarks(frame, handLms, self.mpHands.HAND_CONNECTIONS)
+        if self.roiHands is None:
+            imgRGB = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            self.results = self.hands.process(imgRGB)
+        else:
+            self.results = self.trackHands(frame)
+        if draw:
+            self.drawHands(frame, self.results)
         return frame
 
+    def drawHands(self, frame, results):
+        if results.multi_hand_landmarks:
+            for handLms in results.multi_hand_landmarks:
+                self.mpDraw.draw_landmarks(frame, handLms, self.mpHands.HAND_CONNECTIONS)
+
+    def trackHands(self, frame):
+        """Processes the crop around the hands, falling back to a full detection when due or lost."""
+        results = None
+        if self.roi is not None and self.framesSinceDetect < self.detectEvery:
+            results = self.processRoi(frame)
+            if len(results.multi_hand_landmarks or []) < self.handCount:
+                results = None  # A hand left the crop; look for it in the whole frame
+
+        if results is None:
+            imgRGB = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            results = self.hands.process(imgRGB)
+            self.handCount = len(results.multi_hand_landmarks or [])
+            self.framesSinceDetect = 0
+            self.fullDetections += 1
+
+        self.framesSinceDetect += 1
+        h, w, _ = frame.shape
+        self.roi = self.roiAround(results.multi_hand_landmarks, w, h)
+        return results
+
+    def processRoi(self, frame):
+        """Runs the hand model on the current crop and maps its landmarks back to the full frame."""
+        x, y, side = self.roi
+        crop = frame[y:y + side, x:x + side]
+        interpolation = cv2.INTER_AREA if side > self.roiSize else cv2.INTER_LINEAR
+        crop = cv2.resize(crop, (self.roiSize, self.roiSize), interpolation=interpolation)
+        results = self.roiHands.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+        self.roiFrames += 1
+
+        h, w, _ = frame.shape
+        for handLms in results.multi_hand_landmarks or []:
+            for lm in handLms.landmark:
+                lm.x = (x + lm.x * side) / w
+                lm.y = (y + lm.y * side) / h
+                lm.z = lm.z * side / w  # z shares the x scale
+        return results
+
+    def roiAround(self, handLandmarks, w, h):
+        """Returns a square (x, y, side) around all hands plus padding, kept inside the frame."""
+        if not handLandmarks:
+            return None
+        xs = [lm.x * w for handLms in handLandmarks for lm in handLms.landmark]
+        ys = [lm.y * h for handLms in handLandmarks for lm in handLms.landmark]
+        size = max(max(xs) - min(xs), max(ys) - min(ys))
+        side = int(min(size * (1 + 2 * self.roiPadding), w, h))
+        if side < 16:
+            return None
+        cx, cy = (max(xs) + min(xs)) / 2, (max(ys) + min(ys)) / 2
+        x = int(min(max(cx - side / 2, 0), w - side))
+        y = int(min(max(cy - side / 2, 0), h - side))
+        return x, y, side
+
     def findPosition(self, frame):
-        lmsList = []
-        if self.results.multi_hand_landmarks:
-            for handLms in self.results.multi_hand_landmarks:
-                for id, lm in enumerate(handLms.landmark):
-                    h, w, _ = frame.shape
-                    cx, cy = int(lm.x * w), int(lm.y * h)
-                    lmsList.append([id, cx, cy])
-        return lmsList
+        """Fills the landmark array from the last results and returns the (hands, 21, 3) part in use.
+
+        Coordinates are written straight into the preallocated array, without
+        building a tuple or list per landmark.
+        """
+        handLandmarks = self.results.multi_hand_landmarks or []
+        handedness = self.results.multi_handedness or []
+        self.numHands = min(len(handLandmarks), len(self.landmarks))
+        for i in range(self.numHands):
+            hand = self.landmarks[i]
+            for j, lm in enumerate(handLandmarks[i].landmark):
+                hand[j, 0] = lm.x
+                hand[j, 1] = lm.y
+                hand[j, 2] = lm.z
+            self.handedness[i] = handedness[i].classification[0].label if i < len(handedness) else None
+        h, w, _ = frame.shape
+        hands = self.landmarks[:self.numHands]
+        hands *= (w, h, w)  # z shares the x scale
+        return hands
 
     def fingersUp(self):
-        fingers = []
-        if self.lmsList[self.tipIds[0]][1] > self.lmsList[self.tipIds[0] - 1][1]:  # Thumb
-            fingers.append(1)
-        else:
-            fingers.append(0)
+        """Returns a (hands, 5) array of raised fingers, thumb first, and each hand's label."""
+        hands = self.landmarks[:self.numHands]
+        fingers = np.empty((self.numHands, 5), dtype=np.uint8)
+        # An open thumb points away from the palm: +x for a hand MediaPipe labels
+        # "Left" (the user's right hand, as it assumes a mirrored selfie view),
+        # -x for "Right". Mirroring the frame swaps both the label and the x
+        # direction, so the sign follows the label either way
+        direction = np.array([-1.0 if label == "Right" else 1.0
+                              for label in self.handedness[:self.numHands]], dtype=np.float32)
+        thumbTip, thumbIp = self.tipIds[0], self.tipIds[0] - 1
+        fingers[:, 0] = (hands[:, thumbTip, 0] - hands[:, thumbIp, 0]) * direction > 0
+        tips = self.tipIds[1:]
+        fingers[:, 1:] = hands[:, tips, 1] < hands[:, [tip - 2 for tip in tips], 1]  # Other fingers
+        return fingers, self.handedness[:self.numHands]
+
+GestureResult = namedtuple("GestureResult", ["seq", "timestamp", "frame", "results", "count"])
+
+class GesturePipeline:
+    """Runs capture and hand inference on their own threads, handing results to an output stage.
+
+    The capture thread only keeps the newest frames, and the inference worker
+    always takes the newest one, so a slow model skips frames instead of
+    falling behind. Results wait in a small drop-oldest queue for the output
+    stage (LEDs and display), which runs on the caller's thread.
+    """
+
+    def __init__(self, tracker=None, device=0, queue_size=2, metrics=None):
+        self.tracker = tracker
+        self.metrics = metrics or StreamMetrics()
+        self.engine = CaptureEngine(device, buffer_frames=2, metrics=self.metrics, stream_name="capture")
+        self.output = DropOldestQueue(queue_size)
+        self.frames_skipped = 0  # captured frames the inference worker never saw
+        self._camera_started = False
+        self._running = False
+        self._thread = None
+
+    def open_camera(self):
+        """Starts opening the camera on the capture thread, so it overlaps with building the model."""
+        self._camera_started = self.engine.start(background_open=True)
+
+    def start(self, tracker=None):
+        """Starts the inference worker, opening the camera first unless open_camera() already did.
 
-        for i in range(1, 5):  # Other fingers
-            if self.lmsList[self.tipIds[i]][2] < self.lmsList[self.tipIds[i] - 2][2]:
-                fingers.append(1)
-            else:
-                fingers.append(0)
+        Returns False if the camera won't open.
+        """
+        if tracker is not None:
+            self.tracker = tracker
+        # A background open that failed is reported, not tried a second time
+        if not self.engine.is_running and (self._camera_started or not self.engine.start()):
+            print(self.engine.error or f"Failed to open camera {self.engine.device}")
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._infer, name="inference", daemon=True)
+        self._thread.start()
+        return True
 
-        return fingers
+    def stop(self):
+        self._running = False
+        self.engine.stop()
+        if self._thread:
+            self._thread.join(2.0)
+            self._thread = None
+        self.output.close()
 
-def control_leds(finger_count):
-    # Turn off all LEDs first
-    for pin in LED_PINS:
-        GPIO.output(pin, GPIO.LOW)
+    @property
+    def is_running(self):
+        return self._running and self._thread is not None and self._thread.is_alive()
 
-    # Light up LEDs based on finger count
-    for i in range(finger_count):
-        GPIO.output(LED_PINS[i], GPIO.HIGH)
+    def _infer(self):
+        last_seq = -1
+        while self._running:
+            entry = self.engine.wait_for_frame(last_seq, timeout=0.5)
+            if entry is None:
+                if not self.engine.is_running:
+                    print(self.engine.error or "Camera stream ended.")
+                    break
+                continue
+            if last_seq >= 0:
+                self.frames_skipped += entry.seq - last_seq - 1
+            last_seq = entry.seq
+
+            started = time.perf_counter()
+            self.metrics.record("inference", "wait", max(0.0, time.time() - entry.timestamp))
+            self.tracker.findHands(entry.frame, draw=False)
+            results = self.tracker.results
+            count = count_fingers(self.tracker, entry.frame) if results.multi_hand_landmarks else None
+            self.output.put(GestureResult(entry.seq, entry.timestamp, entry.frame, results, count))
+            self.metrics.record("inference", "process", time.perf_counter() - started)
+            self.metrics.tick("inference")
+        self._running = False
+        self.output.close()
+
+    def report(self):
+        """Returns per-stage throughput and latency as text."""
+        lines = [f"{self.frames_skipped} frames skipped by inference, "
+                 f"{self.output.dropped} results dropped before output"]
+        for stage, data in self.metrics.snapshot().items():
+            # The capture thread doesn't tick; its rate comes from the frame timestamps
+            fps = self.engine.measured_fps() if stage == "capture" else data["fps"]
+            timings = ", ".join(f"{name} p50 {stats['p50_ms']:.1f} p95 {stats['p95_ms']:.1f} ms"
+                                for name, stats in data["stages"].items())
+            lines.append(f"  {stage:<9} {fps:5.1f} fps  {timings}")
+        return "\n".join(lines)
+
+def annotate(frame, tracker, result):
+    """Draws the hands and the finger count of a GestureResult onto `frame`."""
+    tracker.drawHands(frame, result.results)
+    if result.count is not None:
+        cv2.putText(frame, f"Fingers: {result.count}", (50, 100),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
+
+class FramePublisher:
+    """Serves pipeline results to StreamingApp viewers over the port 9999 frame protocol.
+
+    The output stage hands results over with offer(), which only keeps a copy
+    at the publishing rate. Annotating, scaling, encoding and sending all
+    happen in a StreamServer on the publisher's own thread, so a stalled
+    viewer never slows inference. The server reads frames through the same
+    wait_for_frame() interface a CaptureEngine offers.
+    """
+
+    def __init__(self, tracker, host="0.0.0.0", port=frame_protocol.DEFAULT_PORT,
+                 fps=5.0, scale=0.5, annotate=False, quality=70):
+        self.tracker = tracker
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.scale = scale
+        self.annotate = annotate
+        self.quality = quality
+        self.error = None
+        self.frames_offered = 0
+        self.frames_published = 0
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._next_offer = 0.0
+        self._running = False
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(3.0)
+            self._thread = None
+
+    @property
+    def is_running(self):
+        return self._running
+
+    def offer(self, result):
+        """Queues a GestureResult for viewers if one is due; never blocks on the network."""
+        # Headless with nobody watching is the common case, so don't even copy the frame
+        if self._server is None or not self._server.client_count:
+            return
+        now = time.monotonic()
+        if now < self._next_offer:
+            return
+        self._next_offer = max(self._next_offer + 1.0 / self.fps, now)
+        # The output stage may draw on its frame, so keep our own copy
+        with self._cond:
+            self._pending = result._replace(frame=result.frame.copy())
+            self.frames_offered += 1
+            self._cond.notify_all()
+
+    def wait_for_frame(self, after_seq=-1, timeout=1.0):
+        """Returns the newest offered frame as a CapturedFrame, prepared for sending."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending is not None or not self._running, timeout)
+            result, self._pending = self._pending, None
+        if result is None or result.seq <= after_seq:
+            return None
+
+        frame = result.frame
+        if self.annotate:
+            annotate(frame, self.tracker, result)
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        self.frames_published += 1
+        return CapturedFrame(result.seq, result.timestamp, frame)
+
+    def _run(self):
+        import asyncio
+        try:
+            asyncio.run(self._serve())
+        except OSError as e:
+            self.error = f"Publisher failed: {e}"
+            print(self.error)
+            self._running = False
+
+    async def _serve(self):
+        from stream_server import StreamServer
+        server = StreamServer(self, self.host, self.port, quality=self.quality)
+        await server.start()
+        self._server = server
+        try:
+            await server.wait()
+        finally:
+            self._server = None
+            await server.stop()
+
+def process_age():
+    """Returns how long ago this process started, from /proc, or None where that isn't available."""
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19])  # field 22, in clock ticks since boot
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - started / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StartupTimer:
+    """Collects boot-to-ready milestones in seconds since the process started."""
+
+    def __init__(self):
+        age = process_age()
+        # Process start on the perf_counter clock; /proc only has 10 ms resolution, fine here
+        self.origin = time.perf_counter() - age if age is not None else _MODULE_START
+        self.marks = [("interpreter", _MODULE_START - self.origin),
+                      ("imports", _IMPORTS_DONE - self.origin)]
+
+    def mark(self, name, at=None):
+        """Records a milestone now, or at wall-clock time `at`."""
+        now = time.perf_counter()
+        if at is not None:
+            now -= time.time() - at
+        self.marks.append((name, now - self.origin))
+
+    def report(self):
+        return "Startup: " + ", ".join(f"{name} {seconds:.2f} s"
+                                       for name, seconds in sorted(self.marks, key=lambda mark: mark[1]))
+
+def count_fingers(tracker, frame):
+    """Returns the raised fingers of all hands in the tracker's last results, up to 10."""
+    tracker.findPosition(frame)
+    fingers, _ = tracker.fingersUp()
+    return int(fingers.sum())
+
+def landmark_error(reference, candidate, w, h):
+    """Mean pixel distance between matching landmarks, pairing each hand with the nearest wrist."""
+    errors = []
+    for refLms in reference:
+        ref = [(lm.x * w, lm.y * h) for lm in refLms.landmark]
+        best = None
+        for candLms in candidate:
+            cand = [(lm.x * w, lm.y * h) for lm in candLms.landmark]
+            distance = sum(((rx - cx) ** 2 + (ry - cy) ** 2) ** 0.5
+                           for (rx, ry), (cx, cy) in zip(ref, cand)) / len(ref)
+            if best is None or distance < best:
+                best = distance
+        if best is not None:
+            errors.append(best)
+    return errors
+
+def benchmark_clips(paths, detectEvery, roiPadding, roiSize):
+    """Runs recorded clips through full-frame and ROI tracking, reporting speed and agreement."""
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"Failed to open {path}")
+            continue
+        full = HandTracker()
+        roi = HandTracker(detectEvery=detectEvery, roiPadding=roiPadding, roiSize=roiSize)
+        fullTime = roiTime = 0.0
+        frames = handsAgree = fingersAgree = 0
+        errors = []
+
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            h, w, _ = frame.shape
+            start = time.perf_counter()
+            full.findHands(frame, draw=False)
+            fullTime += time.perf_counter() - start
+            start = time.perf_counter()
+            roi.findHands(frame, draw=False)
+            roiTime += time.perf_counter() - start
+
+            fullHands = full.results.multi_hand_landmarks or []
+            roiHands = roi.results.multi_hand_landmarks or []
+            frames += 1
+            handsAgree += len(fullHands) == len(roiHands)
+            fingersAgree += count_fingers(full, frame) == count_fingers(roi, frame)
+            errors.extend(landmark_error(fullHands, roiHands, w, h))
+        cap.release()
+
+        if not frames:
+            print(f"{path}: no frames")
+            continue
+        errors.sort()
+        meanError = sum(errors) / len(errors) if errors else 0.0
+        p95Error = errors[int(0.95 * (len(errors) - 1))] if errors else 0.0
+        print(f"{path}: {frames} frames at {w}x{h}")
+        print(f"  full frame: {frames / fullTime:6.1f} fps")
+        print(f"  roi:        {frames / roiTime:6.1f} fps ({fullTime / roiTime:.2f}x), "
+              f"{roi.fullDetections} full detections, {roi.roiFrames} crops")
+        print(f"  hand count agrees on {handsAgree / frames:.1%} of frames, "
+              f"finger count on {fingersAgree / frames:.1%}")
+        print(f"  landmark error: mean {meanError:.1f} px, p95 {p95Error:.1f} px "
+              f"over {len(errors)} matched hands")
 
 def main():
-    cap = cv2.VideoCapture(0)
-    tracker = HandTracker()
+    parser = argparse.ArgumentParser(description="Count raised fingers and show the count on LEDs.")
+    parser.add_argument("--detect-every", type=int, default=0,
+                        help="run full-frame detection every N frames and track a crop in between (0: always full frame)")
+    parser.add_argument("--roi-padding", type=float, default=0.5,
+                        help="margin around the hands as a fraction of their size")
+    parser.add_argument("--roi-size", type=int, default=192,
+                        help="side in pixels the crop is scaled to before inference")
+    parser.add_argument("--camera", type=int, default=0)
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="results waiting for the output stage before the oldest is dropped")
+    parser.add_argument("--stats-interval", type=float, default=5.0,
+                        help="seconds between stage reports (0: only on exit)")
+    parser.add_argument("--smooth-window", type=int, default=5,
+                        help="frames the LED count is the majority of")
+    parser.add_argument("--hold", type=float, default=0.2,
+                        help="minimum seconds the LEDs keep a count before changing")
+    parser.add_argument("--mock-gpio", action="store_true",
+                        help="print GPIO writes instead of driving the pins")
+    parser.add_argument("--headless", action="store_true",
+                        help="no window and no drawing; stop with Ctrl+C")
+    parser.add_argument("--publish", action="store_true",
+                        help="serve frames to StreamingApp viewers on --publish-port")
+    parser.add_argument("--publish-port", type=int, default=frame_protocol.DEFAULT_PORT)
+    parser.add_argument("--publish-fps", type=float, default=5.0)
+    parser.add_argument("--publish-scale", type=float, default=0.5,
+                        help="size of the published frames relative to the camera's")
+    parser.add_argument("--publish-annotate", action="store_true",
+                        help="draw the hands and finger count on published frames")
+    parser.add_argument("--startup-only", action="store_true",
+                        help="exit after the first decision, e.g. to track boot-to-ready time")
+    parser.add_argument("--benchmark", nargs="+", metavar="CLIP",
+                        help="compare ROI tracking with full-frame processing on recorded clips and exit")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_clips(args.benchmark, args.detect_every or 5, args.roi_padding, args.roi_size)
+        return
+
+    startup = StartupTimer()
+    backend = RecordingBackend(verbose=True) if args.mock_gpio else RPiBackend()
+    leds = LedDriver(LED_PINS, backend, window=args.smooth_window, hold=args.hold)
+    startup.mark("gpio")
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    # The camera opens on its own thread while mediapipe loads and warms up here
+    pipeline = GesturePipeline(device=args.camera, queue_size=args.queue_size)
+    pipeline.open_camera()
+    tracker = HandTracker(detectEvery=args.detect_every, roiPadding=args.roi_padding,
+                          roiSize=args.roi_size)
+    startup.mark("model init")
+    # The capture thread may still be opening the device, so warm up at the requested size
+    tracker.warmUp(pipeline.engine.width or 640, pipeline.engine.height or 480)
+    startup.mark("warm-up")
+    if not pipeline.start(tracker):
+        leds.close()
+        return
+    publisher = None
+    if args.publish:
+        publisher = FramePublisher(tracker, port=args.publish_port, fps=args.publish_fps,
+                                   scale=args.publish_scale, annotate=args.publish_annotate)
+        publisher.start()
+    metrics = pipeline.metrics
+    next_report = time.monotonic() + args.stats_interval
 
-        frame = tracker.findHands(frame)
-        tracker.lmsList = tracker.findPosition(frame)
+    # Output stage: LEDs and display stay on the main thread, which imshow needs
+    try:
+        while True:
+            result = pipeline.output.get(timeout=0.5)
+            if result is None:
+                if not pipeline.is_running:
+                    break
+                continue
 
-        if tracker.lmsList:
-            fingers = tracker.fingersUp()
-            count = fingers.count(1)
-            cv2.putText(frame, f"Fingers: {count}", (50, 100),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
+            started = time.perf_counter()
+            if result.count is not None:
+                leds.update(result.count)  # Control LEDs based on finger count
+            if startup is not None:
+                startup.mark("first frame", at=pipeline.engine.first_frame_time)
+                startup.mark("first decision")
+                print(startup.report())
+                startup = None
+                if args.startup_only:
+                    break
+            if publisher is not None:
+                publisher.offer(result)
 
-            control_leds(count)  # Control LEDs based on finger count
+            if not args.headless:
+                annotate(result.frame, tracker, result)
+                cv2.imshow("Hand Gesture Control", result.frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+            metrics.record("output", "process", time.perf_counter() - started)
+            metrics.record("output", "latency", max(0.0, time.time() - result.timestamp))
+            metrics.tick("output")
 
-        cv2.imshow("Hand Gesture Control", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+            if args.stats_interval > 0 and time.monotonic() >= next_report:
+                print(pipeline.report())
+                next_report = time.monotonic() + args.stats_interval
+    except KeyboardInterrupt:
+        pass
 
-    cap.release()
-    cv2.destroyAllWindows()
-    GPIO.cleanup()
+    pipeline.stop()
+    print(pipeline.report())
+    print(f"LEDs: {leds.changes} changes, {leds.writes} GPIO writes for {leds.updates} counts")
+    if publisher is not None:
+        publisher.stop()
+        print(f"Published {publisher.frames_published} of {publisher.frames_offered} offered frames")
+    if not args.headless:
+        cv2.destroyAllWindows()
+    leds.close()
 
 if __name__ == "__main__":
     main()
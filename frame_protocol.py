@@ -0,0 +1,196 @@
+"""Binary frame protocol used by the remote stream on port 9999.
+
+Every frame goes over the wire as a fixed-size header followed by the
+encoded image payload:
+
+    magic      4s   b"RVFR"
+    version    B    PROTOCOL_VERSION
+    codec      B    CODEC_JPEG, CODEC_PNG or CODEC_RAW
+    channels   B    channels of the decoded image (3 for BGR)
+    (pad)      x
+    width      H
+    height     H
+    seq        I    sender-side sequence number
+    timestamp  d    capture time, seconds since the epoch
+    length     I    payload size in bytes
+
+Receivers may send feedback reports back on the same connection, used by
+adaptive_quality.py to tune the stream:
+
+    magic      4s   b"RVFB"
+    version    B    PROTOCOL_VERSION
+    (pad)      xxx
+    fps        f    frames received per second
+    delay      f    queueing delay in seconds
+    dropped    I    frames dropped since the last report
+    received   I    frames received since the last report
+
+All fields are in network byte order.
+"""
+import socket
+import struct
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+PROTOCOL_VERSION = 1
+MAGIC = b"RVFR"
+FEEDBACK_MAGIC = b"RVFB"
+DEFAULT_PORT = 9999
+
+CODEC_RAW = 0
+CODEC_JPEG = 1
+CODEC_PNG = 2
+
+CODEC_NAMES = {"raw": CODEC_RAW, "jpeg": CODEC_JPEG, "png": CODEC_PNG}
+
+HEADER = struct.Struct("!4sBBBxHHIdI")
+FEEDBACK = struct.Struct("!4sBxxxffII")
+
+# Refuse anything bigger than an uncompressed 4K BGR frame
+MAX_PAYLOAD = 3840 * 2160 * 3
+
+FrameHeader = namedtuple(
+    "FrameHeader", ["codec", "channels", "width", "height", "seq", "timestamp", "length"]
+)
+Feedback = namedtuple("Feedback", ["fps", "delay", "dropped", "received"])
+
+
+class ProtocolError(ValueError):
+    """Raised when the peer sends something that is not a valid frame."""
+
+
+def encode_frame(frame, codec=CODEC_JPEG, quality=80):
+    """Encodes a BGR frame and returns the payload bytes."""
+    if codec == CODEC_RAW:
+        return np.ascontiguousarray(frame).tobytes()
+    if codec == CODEC_JPEG:
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    elif codec == CODEC_PNG:
+        ok, buf = cv2.imencode(".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    else:
+        raise ProtocolError(f"Unknown codec: {codec}")
+    if not ok:
+        raise ProtocolError("Frame encoding failed")
+    return buf.tobytes()
+
+
+def pack_header(frame, codec, seq, timestamp, length):
+    """Packs the header for a frame whose payload is `length` bytes long."""
+    height, width = frame.shape[:2]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, codec, channels,
+                       width, height, seq & 0xFFFFFFFF, timestamp, length)
+
+
+def unpack_header(data):
+    """Validates and unpacks a header, returning a FrameHeader."""
+    magic, version, codec, channels, width, height, seq, timestamp, length = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ProtocolError(f"Bad magic: {magic!r}")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {version}")
+    if codec not in (CODEC_RAW, CODEC_JPEG, CODEC_PNG):
+        raise ProtocolError(f"Unknown codec: {codec}")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload too large: {length} bytes")
+    if codec == CODEC_RAW and length != width * height * channels:
+        raise ProtocolError("Raw payload size does not match frame dimensions")
+    return FrameHeader(codec, channels, width, height, seq, timestamp, length)
+
+
+def pack_feedback(feedback):
+    """Packs a Feedback report for sending back to the frame sender."""
+    return FEEDBACK.pack(FEEDBACK_MAGIC, PROTOCOL_VERSION, feedback.fps, feedback.delay,
+                         feedback.dropped, feedback.received)
+
+
+def unpack_feedback(data):
+    """Validates and unpacks a feedback report, returning a Feedback."""
+    magic, version, fps, delay, dropped, received = FEEDBACK.unpack(data)
+    if magic != FEEDBACK_MAGIC:
+        raise ProtocolError(f"Bad feedback magic: {magic!r}")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {version}")
+    return Feedback(fps, delay, dropped, received)
+
+
+def send_frame(sock, frame, seq, codec=CODEC_JPEG, quality=80, timestamp=None):
+    """Encodes `frame` and sends it on `sock`. Returns the number of bytes sent."""
+    if timestamp is None:
+        timestamp = time.time()
+    payload = encode_frame(frame, codec, quality)
+    header = pack_header(frame, codec, seq, timestamp, len(payload))
+    sock.sendall(header + payload)
+    return HEADER.size + len(payload)
+
+
+class FrameReader:
+    """Reads frames from a connected socket into reusable buffers."""
+
+    def __init__(self, sock, initial_capacity=256 * 1024):
+        self.sock = sock
+        self._header_buf = bytearray(HEADER.size)
+        self._header_view = memoryview(self._header_buf)
+        self._payload_buf = bytearray(initial_capacity)
+        self._payload_view = memoryview(self._payload_buf)
+        self._raw_frame = None
+
+    def _recv_exact(self, view):
+        """Fills `view` completely from the socket."""
+        received = 0
+        size = len(view)
+        while received < size:
+            n = self.sock.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ConnectionError("Connection closed by peer")
+            received += n
+
+    def _ensure_capacity(self, length):
+        if length > len(self._payload_buf):
+            capacity = max(length, 2 * len(self._payload_buf))
+            self._payload_buf = bytearray(capacity)
+            self._payload_view = memoryview(self._payload_buf)
+
+    def read_header(self):
+        """Blocks until the next header has arrived and returns it."""
+        self._recv_exact(self._header_view)
+        return unpack_header(self._header_buf)
+
+    def read_payload(self, header):
+        """Reads the payload for `header` and returns a view onto it."""
+        self._ensure_capacity(header.length)
+        view = self._payload_view[:header.length]
+        self._recv_exact(view)
+        return view
+
+    def decode(self, header, payload):
+        """Decodes a payload into a BGR ndarray.
+
+        Raw frames are copied into a buffer that is reused by the next call.
+        """
+        if header.codec == CODEC_RAW:
+            shape = (header.height, header.width, header.channels)
+            if self._raw_frame is None or self._raw_frame.shape != shape:
+                self._raw_frame = np.empty(shape, dtype=np.uint8)
+            np.copyto(self._raw_frame, np.frombuffer(payload, dtype=np.uint8).reshape(shape))
+            return self._raw_frame
+        frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ProtocolError(f"Could not decode frame {header.seq}")
+        return frame
+
+    def read_frame(self):
+        """Reads and decodes the next frame, returning (header, frame)."""
+        header = self.read_header()
+        payload = self.read_payload(header)
+        return header, self.decode(header, payload)
+
+
+def connect(host, port=DEFAULT_PORT, timeout=5.0):
+    """Opens a TCP connection to a frame sender."""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
@@ -0,0 +1,48 @@
+"""Bounded hand-off between pipeline stages that never blocks the producer.
+
+A slow consumer should see the newest work, not a growing backlog, so
+`DropOldestQueue.put` discards the oldest item when the queue is full and
+counts it in `dropped`.
+"""
+import threading
+from collections import deque
+
+
+class DropOldestQueue:
+    """Thread-safe bounded FIFO that drops its oldest item instead of blocking."""
+
+    def __init__(self, maxsize=1):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, item):
+        """Adds `item`, dropping the oldest one if the queue is full."""
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the oldest item, or None on timeout or once closed and empty."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed, timeout)
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        """Wakes every waiting consumer; items already queued can still be taken."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,210 @@
+"""Offline gesture analysis of recorded videos and image directories.
+
+Every source is split into chunks of consecutive frames that a process pool
+works through, each worker with its own `HandTracker`. Frames are processed
+independently (MediaPipe's static image mode), so the timeline is the same
+however the work is split, and `--verify` checks that against a sequential
+run. The per-frame timeline is written as CSV, NumPy (.npz) or Parquet:
+
+    python gesture_batch.py field_run.mp4 captures/cam0 -o timeline.csv
+    python gesture_batch.py field_run.mp4 -o timeline.npz --workers 4 --verify
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MAX_HANDS = 2
+LABELS = ("", "Left", "Right")  # index stored in the timeline's label fields
+
+# One row per frame; fingers are bit masks with the thumb in bit 0
+TIMELINE_DTYPE = np.dtype(
+    [("source", np.uint16), ("frame", np.uint32), ("time", np.float64),
+     ("hands", np.uint8), ("count", np.uint8)]
+    + [(f"label{i}", np.uint8) for i in range(MAX_HANDS)]
+    + [(f"fingers{i}", np.uint8) for i in range(MAX_HANDS)])
+
+_tracker = None  # the worker's HandTracker
+
+
+def list_images(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def plan_chunks(sources, chunk_frames, image_fps):
+    """Returns (source index, path, start, end, fps) jobs covering every frame of every source.
+
+    A video's last chunk has no end, so a frame count the container reports
+    too low still gets every frame read.
+    """
+    jobs = []
+    for index, path in enumerate(sources):
+        if os.path.isdir(path):
+            total, fps = len(list_images(path)), image_fps
+        else:
+            cap = cv2.VideoCapture(path)
+            if not cap.isOpened():
+                raise SystemExit(f"Failed to open {path}")
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or image_fps
+            cap.release()
+        starts = list(range(0, max(total, 1), chunk_frames))
+        for i, start in enumerate(starts):
+            last = i == len(starts) - 1
+            end = None if last and not os.path.isdir(path) else min(start + chunk_frames, total)
+            jobs.append((index, path, start, end, fps))
+    return jobs
+
+
+def open_video_at(path, start):
+    """Opens a video positioned at frame `start`, decoding up to it where seeking is inexact."""
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            cap.release()
+            cap = cv2.VideoCapture(path)
+            for _ in range(start):
+                if not cap.grab():
+                    break
+    return cap
+
+
+def read_frames(path, start, end):
+    """Yields (frame number, BGR frame) for frames start..end of a video or image directory."""
+    if os.path.isdir(path):
+        for number, name in enumerate(list_images(path)[start:end], start):
+            frame = cv2.imread(name)
+            if frame is not None:
+                yield number, frame
+        return
+
+    cap = open_video_at(path, start)
+    number = start
+    while end is None or number < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield number, frame
+        number += 1
+    cap.release()
+
+
+def init_worker(detection_con):
+    """Creates the worker's tracker; OpenCV keeps to one thread since the pool provides the parallelism."""
+    global _tracker
+    from control_pi import HandTracker
+    cv2.setNumThreads(1)
+    _tracker = HandTracker(maxHands=MAX_HANDS, detectionCon=detection_con, staticImage=True)
+
+
+def analyze_chunk(job):
+    """Runs the tracker over one chunk and returns its rows of the timeline."""
+    index, path, start, end, fps = job
+    rows = []
+    for number, frame in read_frames(path, start, end):
+        _tracker.findHands(frame, draw=False)
+        _tracker.findPosition(frame)
+        fingers, handedness = _tracker.fingersUp()
+
+        row = np.zeros((), dtype=TIMELINE_DTYPE)
+        row["source"], row["frame"], row["time"] = index, number, number / fps
+        row["hands"], row["count"] = len(fingers), fingers.sum()
+        for i in range(len(fingers)):
+            row[f"label{i}"] = LABELS.index(handedness[i]) if handedness[i] in LABELS else 0
+            row[f"fingers{i}"] = int(fingers[i] @ (1 << np.arange(5)))
+        rows.append(row)
+    return np.array(rows, dtype=TIMELINE_DTYPE)
+
+
+def analyze(jobs, workers, detection_con):
+    """Processes every job, in a pool unless `workers` is 1, and returns the timeline in job order."""
+    if workers == 1:
+        init_worker(detection_con)
+        parts = [analyze_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(detection_con,)) as pool:
+            parts = list(pool.map(analyze_chunk, jobs))
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=TIMELINE_DTYPE)
+
+
+def finger_string(mask):
+    return "".join("1" if mask >> bit & 1 else "0" for bit in range(5))
+
+
+def write_timeline(path, timeline, sources):
+    """Writes the timeline as CSV, .npz (with the source paths) or Parquet, chosen by extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npz":
+        np.savez_compressed(path, timeline=timeline, sources=np.array(sources))
+        return
+
+    columns = {
+        "source": [sources[i] for i in timeline["source"]],
+        "frame": timeline["frame"].tolist(),
+        "time": timeline["time"].round(3).tolist(),
+        "hands": timeline["hands"].tolist(),
+        "count": timeline["count"].tolist(),
+    }
+    for i in range(MAX_HANDS):
+        columns[f"hand{i}"] = [LABELS[label] for label in timeline[f"label{i}"]]
+        columns[f"fingers{i}"] = [finger_string(mask) if label else ""
+                                  for label, mask in zip(timeline[f"label{i}"], timeline[f"fingers{i}"])]
+
+    if extension == ".parquet":
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Writing Parquet needs pyarrow; use .csv or .npz instead")
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze hand gestures in recorded videos and image directories.")
+    parser.add_argument("sources", nargs="+", help="video files or directories of images")
+    parser.add_argument("-o", "--output", default="gestures.csv", help=".csv, .npz or .parquet")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-frames", type=int, default=300)
+    parser.add_argument("--image-fps", type=float, default=30.0,
+                        help="frame rate assumed for image directories when computing times")
+    parser.add_argument("--detection-con", type=float, default=0.7)
+    parser.add_argument("--verify", action="store_true",
+                        help="also run sequentially and check both timelines are identical")
+    args = parser.parse_args()
+
+    jobs = plan_chunks(args.sources, args.chunk_frames, args.image_fps)
+    started = time.perf_counter()
+    timeline = analyze(jobs, args.workers, args.detection_con)
+    elapsed = time.perf_counter() - started
+    print(f"{len(timeline)} frames from {len(args.sources)} source(s) in {len(jobs)} chunks: "
+          f"{elapsed:.1f} s with {args.workers} worker(s), {len(timeline) / elapsed:.1f} fps")
+
+    write_timeline(args.output, timeline, args.sources)
+    print(f"Timeline saved: {args.output}")
+
+    if args.verify:
+        started = time.perf_counter()
+        whole_sources = [(index, path, 0, None, fps) for index, path, start, _, fps in jobs if start == 0]
+        sequential = analyze(whole_sources, 1, args.detection_con)
+        elapsed_sequential = time.perf_counter() - started
+        same = np.array_equal(timeline, sequential)
+        print(f"sequential: {elapsed_sequential:.1f} s (pool speedup {elapsed_sequential / elapsed:.2f}x), "
+              f"timelines {'identical' if same else 'DIFFER'}")
+        sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Finger-count LEDs that only touch the pins that change.
+
+`LedDriver` smooths the raw finger count (the most common value over the
+last few frames, held for a minimum time) and remembers the state of every
+pin, so a steady hand costs no GPIO writes at all and a jittery count does
+not make the LEDs flicker.
+
+Pins are driven through a backend with `setup(pins)`, `write(pin, high)`
+and `cleanup()`. `RPiBackend` uses RPi.GPIO on the rover; `RecordingBackend`
+keeps every write in memory so the driver can be exercised on any machine.
+Run this module to simulate a jittery count and compare write counts with
+rewriting every pin on every frame.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter, deque
+
+
+class RPiBackend:
+    """Drives pins with RPi.GPIO using BCM numbering."""
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+
+    def setup(self, pins):
+        self.GPIO.setmode(self.GPIO.BCM)
+        self.GPIO.setup(list(pins), self.GPIO.OUT)
+
+    def write(self, pin, high):
+        self.GPIO.output(pin, self.GPIO.HIGH if high else self.GPIO.LOW)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+
+class RecordingBackend:
+    """Stands in for GPIO, keeping every write as (pin, high) and the current pin levels."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.writes = []
+        self.levels = {}
+
+    def setup(self, pins):
+        for pin in pins:
+            self.levels[pin] = False
+
+    def write(self, pin, high):
+        self.writes.append((pin, high))
+        self.levels[pin] = high
+        if self.verbose:
+            print(f"GPIO{pin} -> {'HIGH' if high else 'LOW'}")
+
+    def cleanup(self):
+        self.levels.clear()
+
+
+class LedDriver:
+    """Shows a smoothed finger count on a row of LEDs, writing only the pins that change."""
+
+    def __init__(self, pins, backend, window=5, hold=0.2):
+        self.pins = list(pins)
+        self.backend = backend
+        self.hold = hold  # seconds a count stays up before it may change
+        self.count = 0
+        self.updates = 0
+        self.changes = 0
+        self.writes = 0
+
+        self._history = deque(maxlen=window)
+        self._changed_at = float("-inf")
+        self._levels = {}
+        backend.setup(self.pins)
+        self._apply(0)
+
+    def update(self, count, now=None):
+        """Feeds one raw finger count and returns the count the LEDs show."""
+        now = time.monotonic() if now is None else now
+        self.updates += 1
+        self._history.append(count)
+
+        votes = Counter(self._history)
+        best = max(votes.values())
+        # On a tie keep what is already shown
+        candidate = self.count if votes[self.count] == best else votes.most_common(1)[0][0]
+        if candidate != self.count and now - self._changed_at >= self.hold:
+            self.count = candidate
+            self.changes += 1
+            self._changed_at = now
+            self._apply(candidate)
+        return self.count
+
+    def _apply(self, count):
+        for i, pin in enumerate(self.pins):
+            high = i < count
+            if self._levels.get(pin) != high:
+                self.backend.write(pin, high)
+                self._levels[pin] = high
+                self.writes += 1
+
+    def close(self):
+        """Turns every LED off and releases the pins."""
+        self._apply(0)
+        self.backend.cleanup()
+
+
+def simulate(frames=600, fps=30.0, jitter=0.2, window=5, hold=0.2, pins=(17, 18, 27, 22, 23), seed=1):
+    """Drives a LedDriver with a stepped finger count plus jitter.
+
+    Returns (driver, backend, naive_writes, raw_changes, final_count), where
+    the naive figures are what rewriting every pin on every frame costs.
+    """
+    rng = random.Random(seed)
+    backend = RecordingBackend()
+    driver = LedDriver(pins, backend, window=window, hold=hold)
+    naive_writes = raw_changes = 0
+    previous = None
+    true_count = 0
+    for i in range(frames):
+        if i % int(2 * fps) == 0:
+            true_count = rng.randint(0, len(pins))
+        count = true_count
+        if rng.random() < jitter:
+            count = min(len(pins), max(0, count + rng.choice((-1, 1))))
+        raw_changes += count != previous
+        previous = count
+        naive_writes += len(pins) + count  # every pin LOW, then `count` pins HIGH
+        driver.update(count, now=i / fps)
+    return driver, backend, naive_writes, raw_changes, true_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the LED driver on a jittery finger count.")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="chance a frame's count is off by one")
+    parser.add_argument("--window", type=int, default=5)
+    parser.add_argument("--hold", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    driver, backend, naive_writes, raw_changes, true_count = simulate(
+        args.frames, args.fps, args.jitter, args.window, args.hold, seed=args.seed)
+    shown = sum(backend.levels.values())
+    print(f"{args.frames} frames: {naive_writes} writes rewriting every pin, "
+          f"{driver.writes} with the driver ({len(backend.writes)} recorded)")
+    print(f"raw count changed {raw_changes} times, LEDs changed {driver.changes} times")
+    ok = shown == driver.count == true_count and driver.writes == len(backend.writes)
+    print(f"final count {true_count}, LEDs show {shown}: {'PASS' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Background video recording.
+
+`VideoRecorder` encodes frames on its own thread. The GUI hands frames over
+through a bounded queue and never waits on the encoder; when the encoder
+falls behind, the queue's drop policy decides which frames are lost. The
+output frame rate is measured from the capture timestamps of the first
+frames rather than assumed.
+
+`SegmentedRecorder` splits a recording into time-bounded Motion-JPEG
+segments. Each segment has a binary sidecar index with one fixed-size
+entry per frame:
+
+    header     4s   b"RVIX"
+               B    INDEX_VERSION
+               xxx
+               d    segment start, seconds since the epoch
+    entry      I    frame number within the recording
+               d    capture timestamp
+               Q    byte offset of the JPEG in the segment file
+               I    JPEG size in bytes
+               B    keyframe flag (always 1 for Motion-JPEG)
+               xxx
+
+`Recording` memory-maps the segments and their indexes so playback can
+jump to any timestamp and decode just that one frame.
+"""
+import glob
+import mmap
+import os
+import queue
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+INDEX_MAGIC = b"RVIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sBxxxd")
+INDEX_ENTRY = struct.Struct("<IdQIB3x")
+INDEX_DTYPE = np.dtype([("frame", "<u4"), ("timestamp", "<f8"), ("offset", "<u8"),
+                        ("size", "<u4"), ("keyframe", "u1"), ("pad", "V3")])
+
+
+class VideoRecorder:
+    """Writes BGR frames to a video file on a worker thread."""
+
+    def __init__(self, filename, frame_size, fps=None, fourcc="XVID",
+                 max_queue=64, drop_policy=DROP_OLDEST, fps_probe_frames=15,
+                 default_fps=20.0):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.filename = filename
+        self.frame_size = frame_size
+        self.fps = fps
+        self.fourcc = fourcc
+        self.drop_policy = drop_policy
+        self.fps_probe_frames = fps_probe_frames
+        self.default_fps = default_fps
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.error = None
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._thread = None
+        self._finishing = None  # encoder thread still writing after stop(wait=False)
+
+    def start(self):
+        """Starts the encoder thread."""
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, timestamp):
+        """Queues a frame for encoding. Returns False if a frame was dropped.
+
+        The frame is not copied, so it must not be modified afterwards.
+        """
+        item = (timestamp, frame)
+        if self.drop_policy == BLOCK:
+            self._queue.put(item)
+            return True
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        if self.drop_policy == DROP_NEWEST:
+            self.note_dropped(1)
+            return False
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.note_dropped(1)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.note_dropped(1)
+        return False
+
+    def note_dropped(self, count):
+        """Accounts for frames that never reached the recorder."""
+        with self._lock:
+            self.frames_dropped += count
+
+    def stop(self, wait=True):
+        """Flushes the queue, closes the file and returns (written, dropped, fps).
+
+        Without `wait` the encoder thread finishes the queued frames in the
+        background and the counts returned are those written so far; call
+        wait() before the process exits, as the thread won't outlive it.
+        """
+        if self._thread:
+            if wait:
+                self._queue.put(None)
+                self._thread.join()
+            else:
+                # The queue may be full, so even queueing the end marker can block
+                threading.Thread(target=self._queue.put, args=(None,), name="recorder-stop",
+                                 daemon=True).start()
+                self._finishing = self._thread
+            self._thread = None
+        return self.frames_written, self.frames_dropped, self.fps
+
+    def wait(self, timeout=None):
+        """Waits for a stop(wait=False) to finish writing. Returns False if it is still writing."""
+        if self._finishing is not None:
+            self._finishing.join(timeout)
+            if self._finishing.is_alive():
+                return False
+            self._finishing = None
+        return True
+
+    def _measure_fps(self, probe):
+        if self.fps is None:
+            self.fps = self.default_fps
+            if len(probe) >= 2:
+                span = probe[-1][0] - probe[0][0]
+                if span > 0:
+                    self.fps = (len(probe) - 1) / span
+
+    def _open_writer(self, probe):
+        self._measure_fps(probe)
+        fourcc = cv2.VideoWriter_fourcc(*self.fourcc)
+        self._writer = cv2.VideoWriter(self.filename, fourcc, self.fps, self.frame_size)
+        if not self._writer.isOpened():
+            self.error = f"Could not open {self.filename} for writing"
+
+    def _write(self, timestamp, frame):
+        if self.error is None:
+            self._writer.write(frame)
+            self.frames_written += 1
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+    def _run(self):
+        probe = []
+        opened = False
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if not opened:
+                # Hold the first frames back until we know the real frame rate
+                probe.append(item)
+                if self.fps is None and len(probe) < self.fps_probe_frames:
+                    continue
+                self._open_writer(probe)
+                opened = True
+                for timestamp, frame in probe:
+                    self._write(timestamp, frame)
+                probe = []
+                continue
+            self._write(*item)
+
+        if not opened and probe:
+            self._open_writer(probe)
+            for timestamp, frame in probe:
+                self._write(timestamp, frame)
+        self._close_writer()
+
+
+class SegmentedRecorder(VideoRecorder):
+    """Records time-bounded Motion-JPEG segments, each with a binary frame index.
+
+    `directory` receives segment_NNNN.mjpeg files and their segment_NNNN.idx
+    sidecars. Every frame is a keyframe whose byte offset is known, which
+    cv2.VideoWriter can't tell us, so playback can seek without decoding
+    from the start of a segment.
+    """
+
+    def __init__(self, directory, frame_size, segment_seconds=60.0, quality=85, **kwargs):
+        super().__init__(directory, frame_size, fourcc="MJPG", **kwargs)
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.quality = quality
+        self.segments = []  # base paths of the segments written so far
+        self._video = None
+        self._index = None
+        self._segment_start = None
+
+    def _open_writer(self, probe):
+        self._measure_fps(probe)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            self.error = f"Could not create {self.directory}: {e}"
+
+    def _next_segment(self, timestamp):
+        self._close_writer()
+        base = os.path.join(self.directory, f"segment_{len(self.segments):04d}")
+        try:
+            self._video = open(base + ".mjpeg", "wb")
+            self._index = open(base + ".idx", "wb")
+            self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, timestamp))
+        except OSError as e:
+            self.error = f"Could not open {base} for writing: {e}"
+            return
+        self.segments.append(base)
+        self._segment_start = timestamp
+
+    def _write(self, timestamp, frame):
+        if self.error is None and (self._video is None
+                                   or timestamp - self._segment_start >= self.segment_seconds):
+            self._next_segment(timestamp)
+        if self.error is not None:
+            return
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            self.error = f"Could not encode frame {self.frames_written}"
+            return
+        try:
+            offset = self._video.tell()
+            self._video.write(buf)
+            self._index.write(INDEX_ENTRY.pack(self.frames_written, timestamp, offset, len(buf), 1))
+            # Keep the files readable by playback while the recording is still running
+            self._video.flush()
+            self._index.flush()
+        except OSError as e:
+            self.error = f"Could not write to {self.segments[-1]}: {e}"
+            return
+        self.frames_written += 1
+
+    def _close_writer(self):
+        for f in (self._video, self._index):
+            if f is not None:
+                f.close()
+        self._video = self._index = None
+
+
+class Segment:
+    """One recorded segment with its memory-mapped video file and index."""
+
+    def __init__(self, base):
+        self.base = base
+        self._files = []
+        self._maps = []
+        index_map = self._map(base + ".idx")
+        if index_map is None or len(index_map) < INDEX_HEADER.size:
+            # Just created by a recorder that hasn't written a frame yet
+            self.start_time = None
+            self.entries = self.timestamps = np.empty(0, dtype=INDEX_DTYPE)
+            self._video = None
+            return
+        magic, version, self.start_time = INDEX_HEADER.unpack_from(index_map)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"Not a recording index: {base}.idx")
+        count = (len(index_map) - INDEX_HEADER.size) // INDEX_DTYPE.itemsize
+        entries = np.frombuffer(index_map, dtype=INDEX_DTYPE, count=count, offset=INDEX_HEADER.size)
+
+        self._video = self._map(base + ".mjpeg")
+        video_size = len(self._video) if self._video is not None else 0
+        # A segment still being written may index frames that are not fully on disk yet
+        complete = entries["offset"] + entries["size"] <= video_size
+        self.entries = entries[:np.argmin(complete)] if not complete.all() else entries
+        self.timestamps = self.entries["timestamp"]
+
+    def _map(self, path):
+        """Maps `path` read-only. Returns None if it is missing or empty, as in a segment cut short."""
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return None
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(m)
+        return m
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read(self, index):
+        """Decodes frame `index` of this segment. Returns (timestamp, frame)."""
+        entry = self.entries[index]
+        data = np.frombuffer(self._video, dtype=np.uint8, count=int(entry["size"]),
+                             offset=int(entry["offset"]))
+        frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError(f"Could not decode frame {entry['frame']} of {self.base}")
+        return float(entry["timestamp"]), frame
+
+    def close(self):
+        # Views onto the maps have to go before the maps can close
+        self.entries = self.timestamps = None
+        for m in self._maps:
+            try:
+                m.close()
+            except BufferError:
+                pass  # a decoded frame's source buffer is still referenced; let GC finish
+        for f in self._files:
+            f.close()
+
+
+class Recording:
+    """A segmented recording, seekable by capture timestamp across segments."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        for index_path in sorted(glob.glob(os.path.join(directory, "segment_*.idx"))):
+            segment = Segment(index_path[:-len(".idx")])
+            if len(segment):
+                self.segments.append(segment)
+            else:
+                segment.close()
+        if not self.segments:
+            raise ValueError(f"No recorded frames in {directory}")
+        self._starts = np.array([segment.timestamps[0] for segment in self.segments])
+
+    @property
+    def start_time(self):
+        return float(self.segments[0].timestamps[0])
+
+    @property
+    def end_time(self):
+        return float(self.segments[-1].timestamps[-1])
+
+    @property
+    def frame_count(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def locate(self, timestamp):
+        """Returns (segment number, frame index) of the last frame at or before `timestamp`."""
+        number = max(0, int(np.searchsorted(self._starts, timestamp, side="right")) - 1)
+        segment = self.segments[number]
+        index = max(0, int(np.searchsorted(segment.timestamps, timestamp, side="right")) - 1)
+        return number, index
+
+    def next_position(self, number, index):
+        """Returns the position after (number, index), or None at the end of the recording."""
+        if index + 1 < len(self.segments[number]):
+            return number, index + 1
+        if number + 1 < len(self.segments):
+            return number + 1, 0
+        return None
+
+    def read(self, number, index):
+        """Decodes one frame. Returns (timestamp, frame)."""
+        return self.segments[number].read(index)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
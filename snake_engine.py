@@ -0,0 +1,303 @@
+"""Snake game logic without any rendering.
+
+`SnakeGame` plays one game: the body is a deque of cells and an occupancy
+grid answers "is this cell taken" in O(1), both for self-collisions and for
+placing food only on free cells. snake_final.py draws it with pygame.
+
+`SnakeBatch` steps thousands of games in lockstep with NumPy, for agent
+training and benchmarking. Instead of a body it remembers, per game and
+cell, the step at which the head last entered the cell; the cell is part of
+the body while that step is among the last `length` ones. Both follow the
+same rules, which this module checks when run:
+
+    python snake_engine.py --games 4096 --steps 1000
+    python snake_engine.py --check 64
+"""
+import argparse
+import random
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+# Directions clockwise from up; a snake that hasn't started moving has STOPPED
+UP, RIGHT, DOWN, LEFT = range(4)
+STOPPED = -1
+DX = (0, 1, 0, -1)
+DY = (-1, 0, 1, 0)
+
+
+def can_turn(current, direction):
+    """Only quarter turns are allowed once moving, so the snake can't reverse into itself."""
+    return current == STOPPED or (direction - current) % 2 == 1
+
+
+class SnakeGame:
+    """One game on a cols x rows grid, starting in the middle and standing still."""
+
+    def __init__(self, cols=80, rows=60, rng=None):
+        self.cols = cols
+        self.rows = rows
+        self.rng = rng or random.Random()
+        self.reset()
+
+    def reset(self):
+        self.body = deque()  # cells from tail to head
+        self.occupied = np.zeros((self.rows, self.cols), dtype=bool)
+        self.direction = STOPPED
+        self.length = 1
+        self.score = 0
+        self.steps = 0
+        self.alive = True
+        self.ate = False
+        self.vacated = None  # the tail cell the last step freed, for incremental renderers
+        self._add_head((self.cols // 2, self.rows // 2))
+        self.food = self.place_food()
+
+    @property
+    def head(self):
+        return self.body[-1]
+
+    def turn(self, direction):
+        """Changes direction unless that would reverse the snake."""
+        if can_turn(self.direction, direction):
+            self.direction = direction
+
+    def step(self):
+        """Moves the snake one cell. Returns False once the game is over."""
+        if not self.alive:
+            return False
+        self.steps += 1
+        self.ate = False
+        self.vacated = None
+        x, y = self.head
+        if self.direction != STOPPED:
+            x, y = x + DX[self.direction], y + DY[self.direction]
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
+            self.alive = False
+            return False
+
+        # The tail moves on before the head arrives, so following it is safe
+        if len(self.body) >= self.length:
+            tail_x, tail_y = self.vacated = self.body.popleft()
+            self.occupied[tail_y, tail_x] = False
+        collided = self.occupied[y, x]
+        self._add_head((x, y))
+
+        if (x, y) == self.food:
+            self.length += 1
+            self.score += 1
+            self.ate = True
+            self.food = self.place_food()
+        if collided:
+            self.alive = False
+        return self.alive
+
+    def place_food(self):
+        """Returns a random free cell, or None when the snake fills the board."""
+        for _ in range(8):
+            cell = (self.rng.randrange(self.cols), self.rng.randrange(self.rows))
+            if not self.occupied[cell[1], cell[0]]:
+                return cell
+        # A crowded board: pick among the free cells directly
+        free = np.flatnonzero(~self.occupied)
+        if not len(free):
+            return None
+        y, x = divmod(int(free[self.rng.randrange(len(free))]), self.cols)
+        return x, y
+
+    def _add_head(self, cell):
+        self.body.append(cell)
+        self.occupied[cell[1], cell[0]] = True
+
+
+class SnakeBatch:
+    """Steps `games` independent games in lockstep; every state field is an array over games."""
+
+    def __init__(self, games, cols=80, rows=60, seed=None, auto_reset=False):
+        self.games = games
+        self.cols = cols
+        self.rows = rows
+        self.auto_reset = auto_reset  # restart finished games on the next step, as training loops want
+        self.rng = np.random.default_rng(seed)
+        self._dx = np.array(DX + (0,))  # STOPPED (-1) indexes the trailing 0
+        self._dy = np.array(DY + (0,))
+        self._index = np.arange(games)
+
+        # Step at which the head last entered each cell; far in the past means never
+        self.entered = np.full((games, rows, cols), -2 ** 30, dtype=np.int32)
+        self.clock = np.zeros(games, dtype=np.int32)
+        self.x = np.zeros(games, dtype=np.int32)
+        self.y = np.zeros(games, dtype=np.int32)
+        self.direction = np.full(games, STOPPED, dtype=np.int8)
+        self.length = np.ones(games, dtype=np.int32)
+        self.score = np.zeros(games, dtype=np.int32)
+        self.alive = np.ones(games, dtype=bool)
+        self.food_x = np.zeros(games, dtype=np.int32)
+        self.food_y = np.zeros(games, dtype=np.int32)
+        self.reset()
+
+    def reset(self, mask=None):
+        """Restarts the games selected by `mask`, or all of them."""
+        index = self._index if mask is None else np.flatnonzero(mask)
+        # Cells of the old body need no clearing: the clock keeps running and
+        # a length of 1 leaves them in the past
+        self.x[index] = self.cols // 2
+        self.y[index] = self.rows // 2
+        self.direction[index] = STOPPED
+        self.length[index] = 1
+        self.score[index] = 0
+        self.alive[index] = True
+        self.entered[index, self.y[index], self.x[index]] = self.clock[index]
+        self._place_food(index)
+
+    def occupied(self, index, x, y):
+        """Returns whether cells (x, y) of games `index` are part of their snakes' bodies."""
+        return self.entered[index, y, x] > self.clock[index] - self.length[index]
+
+    def step(self, actions=None):
+        """Applies one action per game (a direction, or -1 to keep going) and moves every live snake.
+
+        Returns (ate, died) boolean arrays for this step.
+        """
+        if self.auto_reset and not self.alive.all():
+            self.reset(~self.alive)
+        if actions is not None:
+            actions = np.asarray(actions)
+            turn = (actions >= 0) & ((self.direction == STOPPED) | ((actions - self.direction) % 2 == 1))
+            self.direction[turn] = actions[turn]
+
+        index = np.flatnonzero(self.alive)
+        direction = self.direction[index]
+        x = self.x[index] + self._dx[direction]
+        y = self.y[index] + self._dy[direction]
+        self.clock[index] += 1
+
+        died = np.zeros(self.games, dtype=bool)
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        died[index[~inside]] = True
+        index, x, y = index[inside], x[inside], y[inside]
+
+        # The body the head may hit is the previous length - 1 cells; the tail has moved on
+        collided = self.entered[index, y, x] > self.clock[index] - self.length[index]
+        self.entered[index, y, x] = self.clock[index]
+        self.x[index], self.y[index] = x, y
+
+        ate = np.zeros(self.games, dtype=bool)
+        eating = (x == self.food_x[index]) & (y == self.food_y[index])
+        ate[index[eating]] = True
+        # Place food before growing, so the cell the tail just left counts as free, as in SnakeGame
+        self._place_food(index[eating])
+        self.length[index[eating]] += 1
+        self.score[index[eating]] += 1
+
+        died[index[collided]] = True
+        self.alive[died] = False
+        return ate, died
+
+    def _place_food(self, index):
+        """Puts food on a random free cell of each game in `index`."""
+        pending = index
+        for _ in range(8):
+            if not len(pending):
+                return
+            x = self.rng.integers(0, self.cols, len(pending))
+            y = self.rng.integers(0, self.rows, len(pending))
+            free = ~self.occupied(pending, x, y)
+            self.food_x[pending[free]] = x[free]
+            self.food_y[pending[free]] = y[free]
+            pending = pending[~free]
+        # Crowded boards: pick among the free cells directly
+        for game in pending:
+            cells = np.flatnonzero(self.entered[game] <= self.clock[game] - self.length[game])
+            if len(cells):
+                self.food_y[game], self.food_x[game] = divmod(int(self.rng.choice(cells)), self.cols)
+            else:
+                self.food_x[game] = self.food_y[game] = -1  # the snake fills the board
+
+
+def check_agreement(games=64, steps=2000, cols=20, rows=15, seed=1):
+    """Plays the same random actions through SnakeBatch and one SnakeGame per game.
+
+    Each SnakeGame is given the batch's food position, so both must agree
+    on every head position, length, score and death. Returns the number of
+    mismatching games.
+    """
+    rng = np.random.default_rng(seed)
+    batch = SnakeBatch(games, cols, rows, seed=seed)
+    singles = [SnakeGame(cols, rows) for _ in range(games)]
+    mismatched = set()
+    for game, single in enumerate(singles):
+        single.food = (int(batch.food_x[game]), int(batch.food_y[game]))
+
+    for _ in range(steps):
+        # Mostly keep going, sometimes turn, like a wandering player
+        actions = np.where(rng.random(games) < 0.2, rng.integers(0, 4, games), -1)
+        batch.step(actions)
+        for game, single in enumerate(singles):
+            if not single.alive:
+                continue
+            if actions[game] >= 0:
+                single.turn(int(actions[game]))
+            single.step()
+            if single.ate or single.food is None:
+                single.food = (int(batch.food_x[game]), int(batch.food_y[game]))
+            state = (single.alive, single.head, single.length, single.score)
+            expected = (bool(batch.alive[game]), (int(batch.x[game]), int(batch.y[game])),
+                        int(batch.length[game]), int(batch.score[game]))
+            if state != expected:
+                mismatched.add(game)
+        if not batch.alive.any():
+            break
+    return len(mismatched)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark or check the headless snake engine.")
+    parser.add_argument("--games", type=int, default=4096)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--cols", type=int, default=80)
+    parser.add_argument("--rows", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", type=int, metavar="GAMES",
+                        help="compare the batched engine with single games and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        mismatched = check_agreement(args.check, args.steps, seed=args.seed)
+        print(f"{args.check} games: {mismatched} mismatched: {'PASS' if not mismatched else 'FAIL'}")
+        sys.exit(1 if mismatched else 0)
+
+    rng = np.random.default_rng(args.seed)
+    batch = SnakeBatch(args.games, args.cols, args.rows, seed=args.seed, auto_reset=True)
+    actions = np.where(rng.random((args.steps, args.games)) < 0.2,
+                       rng.integers(0, 4, (args.steps, args.games)), -1)
+    started = time.perf_counter()
+    eaten = deaths = 0
+    for step in range(args.steps):
+        ate, died = batch.step(actions[step])
+        eaten += int(ate.sum())
+        deaths += int(died.sum())
+    batched = time.perf_counter() - started
+
+    single = SnakeGame(args.cols, args.rows, random.Random(args.seed))
+    single_steps = min(args.steps * args.games, 200000)
+    started = time.perf_counter()
+    for step in range(single_steps):
+        action = actions[step % args.steps, step % args.games]
+        if action >= 0:
+            single.turn(int(action))
+        if not single.step():
+            single.reset()
+    sequential = time.perf_counter() - started
+
+    total = args.steps * args.games
+    print(f"batched: {args.games} games x {args.steps} steps in {batched:.2f} s, "
+          f"{total / batched / 1e6:.2f} M game-steps/s ({eaten} food eaten, {deaths} deaths)")
+    print(f"single:  {single_steps / sequential / 1e6:.2f} M game-steps/s "
+          f"({sequential / single_steps * total / batched:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
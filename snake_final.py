@@ -1,6 +1,7 @@
 import pygame
 import sys
-import random
+
+from snake_engine import DOWN, LEFT, RIGHT, UP, SnakeGame
 
 # Initialize Pygame
 pygame.init()
@@ -28,11 +29,6 @@ speed = 15
 font = pygame.font.SysFont("bahnschrift", 25)
 game_over_font = pygame.font.SysFont("bahnschrift", 50)
 
-# Function to display the score
-def show_score(score):
-    score_text = font.render(f"Score: {score}", True, WHITE)
-    screen.blit(score_text, [10, 10])
-
 # Function to display the "Game Over" message
 def game_over_screen():
     screen.fill(BLUE)
@@ -75,91 +71,109 @@ def start_screen():
                 if event.key == pygame.K_s:
                     waiting = False
 
-# Main game loop
-def main():
-    # Snake properties
-    x = WIDTH // 2
-    y = HEIGHT // 2
-    x_change = 0
-    y_change = 0
-    snake_body = []
-    snake_length = 1
-
-    # Food position
-    food_x = random.randint(0, (WIDTH // block_size) - 1) * block_size
-    food_y = random.randint(0, (HEIGHT // block_size) - 1) * block_size
+# Arrow keys and the direction each one turns the snake
+DIRECTION_KEYS = {pygame.K_UP: UP, pygame.K_RIGHT: RIGHT, pygame.K_DOWN: DOWN, pygame.K_LEFT: LEFT}
+
+# Function to draw one grid cell; returns the rect it covered
+def draw_cell(color, cell):
+    return pygame.draw.rect(screen, color, [cell[0] * block_size, cell[1] * block_size, block_size, block_size])
+
+class BoardRenderer:
+    """Draws a SnakeGame incrementally: each tick only the new head, the vacated
+    tail cell, moved food and a changed score are drawn, and only those rects are
+    pushed to the display, so frame time doesn't grow with the snake."""
+
+    def __init__(self, game):
+        self.game = game
+        self.food = None
+        self.score = None
+        self.score_surface = None
+        self.score_rect = pygame.Rect(10, 10, 0, 0)
+        self.needs_full_redraw = True  # set again whenever another screen covered the board
+
+    def draw(self):
+        game = self.game
+        if self.needs_full_redraw:
+            self.redraw()
+            return
+
+        dirty = []
+        if game.vacated is not None:
+            dirty.append(draw_cell(BLUE, game.vacated))
+        dirty.append(draw_cell(GREEN, game.head))  # after the tail, in case the head took its cell
+        if game.food != self.food:
+            self.food = game.food
+            if game.food is not None:
+                dirty.append(draw_cell(RED, game.food))
+
+        # The score sits on top of the board, so redraw its area whenever anything under it changed
+        score_area = self.score_rect
+        score_changed = game.score != self.score
+        if score_changed:
+            self.render_score()
+            score_area = score_area.union(self.score_rect)
+        if score_changed or score_area.collidelist(dirty) != -1:
+            self.redraw_area(score_area)
+            dirty.append(score_area)
+
+        pygame.display.update(dirty)
+
+    def render_score(self):
+        """Renders the score text once per change; blits reuse the cached surface."""
+        self.score = self.game.score
+        self.score_surface = font.render(f"Score: {self.score}", True, WHITE)
+        self.score_rect = self.score_surface.get_rect(topleft=(10, 10))
+
+    def redraw_area(self, area):
+        """Repaints the board cells inside `area` and the score on top of them."""
+        game = self.game
+        screen.set_clip(area)
+        screen.fill(BLUE)
+        for y in range(area.top // block_size, min(game.rows, (area.bottom - 1) // block_size + 1)):
+            for x in range(area.left // block_size, min(game.cols, (area.right - 1) // block_size + 1)):
+                if game.occupied[y, x]:
+                    draw_cell(GREEN, (x, y))
+                elif (x, y) == game.food:
+                    draw_cell(RED, (x, y))
+        screen.blit(self.score_surface, self.score_rect)
+        screen.set_clip(None)
+
+    def redraw(self):
+        """Draws the whole board and pushes the full frame."""
+        game = self.game
+        screen.fill(BLUE)
+        self.food = game.food
+        if game.food is not None:
+            draw_cell(RED, game.food)
+        for segment in game.body:
+            draw_cell(GREEN, segment)
+        self.render_score()
+        screen.blit(self.score_surface, self.score_rect)
+        pygame.display.update()
+        self.needs_full_redraw = False
 
-    # Score
-    score = 0
+# Main game loop; the rules live in snake_engine, this only handles input and drawing
+def main():
+    game = SnakeGame(WIDTH // block_size, HEIGHT // block_size)
+    renderer = BoardRenderer(game)
 
     running = True
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_LEFT and x_change == 0:
-                    x_change = -block_size
-                    y_change = 0
-                elif event.key == pygame.K_RIGHT and x_change == 0:
-                    x_change = block_size
-                    y_change = 0
-                elif event.key == pygame.K_UP and y_change == 0:
-                    y_change = -block_size
-                    x_change = 0
-                elif event.key == pygame.K_DOWN and y_change == 0:
-                    y_change = block_size
-                    x_change = 0
-
-        # Update the block position
-        x += x_change
-        y += y_change
-
-        # Check if the snake hits the wall
-        if x < 0 or x >= WIDTH or y < 0 or y >= HEIGHT:
+            if event.type == pygame.KEYDOWN and event.key in DIRECTION_KEYS:
+                game.turn(DIRECTION_KEYS[event.key])
+
+        # Move the snake; hitting a wall or itself ends the game
+        if not game.step():
             if game_over_screen():
                 return  # Restart the game
             else:
                 running = False  # Quit the game
 
-        # Clear the screen
-        screen.fill(BLUE)
-
-        # Draw the food
-        pygame.draw.rect(screen, RED, [food_x, food_y, block_size, block_size])
-
-        # Add the new position to the snake's body
-        snake_body.append([x, y])
-        if len(snake_body) > snake_length:
-            del snake_body[0]  # Remove the oldest segment to maintain the length
-
-        # Draw the snake
-        for segment in snake_body:
-            pygame.draw.rect(screen, GREEN, [segment[0], segment[1], block_size, block_size])
-
-        # Check if the snake eats the food
-        if x == food_x and y == food_y:
-            # Increase the length of the snake
-            snake_length += 1
-            # Increase the score
-            score += 1
-            # Generate new food position
-            food_x = random.randint(0, (WIDTH // block_size) - 1) * block_size
-            food_y = random.randint(0, (HEIGHT // block_size) - 1) * block_size
-
-        # Check if the snake collides with itself
-        for segment in snake_body[:-1]:
-            if segment == [x, y]:
-                if game_over_screen():
-                    return  # Restart the game
-                else:
-                    running = False  # Quit the game
-
-        # Show the score
-        show_score(score)
-
-        # Update the display
-        pygame.display.update()
+        # Draw what changed and update only those parts of the display
+        renderer.draw()
 
         # Control the speed
         clock.tick(speed)
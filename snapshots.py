@@ -0,0 +1,94 @@
+"""Still image and burst capture.
+
+`SnapshotService` never touches the camera. It is fed the frames the
+capture engine has already produced, keeps a short pre-trigger history of
+them, and encodes images on a thread pool so PNG compression never runs on
+the GUI thread.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+
+def frame_filename(directory, prefix, entry):
+    """Builds a collision-free file name from a frame's capture time and sequence number."""
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(entry.timestamp))
+    millis = int((entry.timestamp % 1) * 1000)
+    return os.path.join(directory, f"{prefix}_{stamp}_{millis:03d}_{entry.seq:06d}.png")
+
+
+class SnapshotService:
+    """Saves single frames and bursts of frames on a thread pool."""
+
+    def __init__(self, directory="captures", workers=2, pretrigger_seconds=2.0):
+        self.directory = directory
+        self.pretrigger_seconds = pretrigger_seconds
+        self._history = deque()
+        self._bursts = []  # [directory, frames remaining]
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot")
+
+    def feed(self, entry):
+        """Records a newly captured frame for the pre-trigger history and any running bursts."""
+        with self._lock:
+            self._history.append(entry)
+            cutoff = entry.timestamp - self.pretrigger_seconds
+            while self._history and self._history[0].timestamp < cutoff:
+                self._history.popleft()
+
+            for burst in self._bursts:
+                self._save(burst[0], "burst", entry)
+                burst[1] -= 1
+            self._bursts = [burst for burst in self._bursts if burst[1] > 0]
+
+    def snapshot(self, entry):
+        """Saves a single frame. Returns a future resolving to the file name."""
+        return self._save(self.directory, "capture", entry)
+
+    def start_burst(self, count):
+        """Saves the next `count` frames fed to the service. Returns the burst directory."""
+        directory = self._burst_directory()
+        with self._lock:
+            self._bursts.append([directory, count])
+        return directory
+
+    def save_pretrigger(self, seconds=None):
+        """Saves the buffered frames from the last `seconds`. Returns (directory, count)."""
+        with self._lock:
+            frames = list(self._history)
+        if frames and seconds is not None:
+            cutoff = frames[-1].timestamp - seconds
+            frames = [entry for entry in frames if entry.timestamp >= cutoff]
+        directory = self._burst_directory()
+        for entry in frames:
+            self._save(directory, "burst", entry)
+        return directory, len(frames)
+
+    def clear(self):
+        """Forgets the pre-trigger history, e.g. when the stream stops."""
+        with self._lock:
+            self._history.clear()
+
+    def shutdown(self, wait=True):
+        """Stops accepting work; pending writes finish, in the background unless `wait`."""
+        self._pool.shutdown(wait=wait)
+
+    def _burst_directory(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        millis = int((time.time() % 1) * 1000)
+        return os.path.join(self.directory, f"burst_{stamp}_{millis:03d}")
+
+    def _save(self, directory, prefix, entry):
+        filename = frame_filename(directory, prefix, entry)
+        return self._pool.submit(self._write, directory, filename, entry.frame)
+
+    @staticmethod
+    def _write(directory, filename, frame):
+        os.makedirs(directory, exist_ok=True)
+        if not cv2.imwrite(filename, frame):
+            raise OSError(f"Could not write {filename}")
+        return filename
@@ -1,20 +1,297 @@
 import cv2
+import math
 import os
+import select
 import socket
-import struct
-import pickle
 import sys
+import threading
+import time
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout,
     QHBoxLayout, QPushButton, QLineEdit, QFrame, QDockWidget,
-    QRadioButton, QButtonGroup, QComboBox, QLabel, QToolBar
+    QLabel, QToolBar,
+    QGridLayout, QListWidget, QListWidgetItem, QCheckBox, QSlider, QFileDialog
 )
-from PySide6.QtGui import QAction, QIcon, QPixmap, QImage
-from PySide6.QtCore import Qt, QSize, QTimer
+from PySide6.QtGui import QAction, QIcon
+from PySide6.QtCore import Qt, QSize, QTimer, QThread, Signal
+
+import frame_protocol
+import udp_transport
+from adaptive_quality import FeedbackTracker
+from capture_engine import CaptureEngine, DeviceScanner
+from recording import Recording, SegmentedRecorder
+from snapshots import SnapshotService
+from stream_metrics import StreamMetrics
+from video_widget import VideoWidget
+
+
+class RemoteStreamReceiver(QThread):
+    """Drains the remote stream socket on a worker thread.
+
+    Only the newest decoded frame is kept. The GUI is notified through the
+    queued `frame_ready` signal and collects the frame with `take_frame`, so
+    a slow UI never makes frames pile up in the socket buffer. Once a second
+    it reports achieved FPS, queueing delay and drops back to the sender so
+    the sender can adapt the stream quality.
+    """
+    frame_ready = Signal()
+    stream_closed = Signal(str)
+
+    def __init__(self, sock, metrics=None, parent=None):
+        super().__init__(parent)
+        self.sock = sock
+        self.metrics = metrics
+        self.sock.settimeout(None)  # stop() unblocks recv by shutting the socket down
+        self.reader = frame_protocol.FrameReader(sock)
+        self._lock = threading.Lock()
+        self._latest = None
+        self._pending = False
+        self._running = True
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.feedback = FeedbackTracker()
+        self.native_id = None
+
+    def _newer_frame_waiting(self):
+        """Returns True if the next frame's header is already buffered."""
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        if not readable:
+            return False
+        return len(self.sock.recv(frame_protocol.HEADER.size, socket.MSG_PEEK)) == frame_protocol.HEADER.size
+
+    def run(self):
+        self.native_id = threading.get_native_id()  # lets profilers attribute this thread's CPU time
+        while self._running:
+            try:
+                header = self.reader.read_header()
+                started = time.perf_counter()
+                payload = self.reader.read_payload(header)
+                received = time.perf_counter()
+                self.frames_received += 1
+                self.feedback.on_frame(header.timestamp)
+                self._send_feedback()
+
+                # Skip decoding when we are already behind the sender
+                if self._newer_frame_waiting():
+                    self.frames_dropped += 1
+                    self.feedback.on_dropped()
+                    continue
+
+                frame = self.reader.decode(header, payload)
+                if header.codec == frame_protocol.CODEC_RAW:
+                    frame = frame.copy()  # the reader reuses its raw buffer
+                if self.metrics is not None:
+                    self.metrics.record("remote", "receive", received - started)
+                    self.metrics.record("remote", "decode", time.perf_counter() - received)
+                    # Sender and receiver clocks may differ; only meaningful when they are synced
+                    self.metrics.record("remote", "transit", max(0.0, time.time() - header.timestamp))
+            except (OSError, frame_protocol.ProtocolError) as e:
+                if self._running:
+                    self.stream_closed.emit(str(e))
+                return
+
+            self._deliver(header, frame)
+
+    def _deliver(self, header, frame):
+        """Makes `frame` the newest frame and tells the GUI unless a notification is pending."""
+        with self._lock:
+            if self._pending:
+                self.frames_dropped += 1  # the GUI never picked up the previous one
+                self.feedback.on_dropped()
+            self._latest = (header, frame)
+            notify = not self._pending
+            self._pending = True
+        if notify:
+            self.frame_ready.emit()
+
+    def _send_feedback(self):
+        """Sends a feedback report to the sender when one is due."""
+        report = self.feedback.report()
+        if report is not None:
+            self.sock.sendall(frame_protocol.pack_feedback(report))
+
+    def take_frame(self):
+        """Returns the newest (header, frame) pair, or None if there is none."""
+        with self._lock:
+            latest = self._latest
+            self._latest = None
+            self._pending = False
+        return latest
+
+    def stop(self):
+        """Stops the worker and waits for it to exit."""
+        self._running = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.wait()
+
+
+class UdpStreamReceiver(RemoteStreamReceiver):
+    """Receives the remote stream as UDP datagrams.
+
+    A lost datagram only costs the frame it belonged to: incomplete frames
+    are dropped after a deadline and the newest complete frame is shown.
+    """
+
+    def __init__(self, sock, sender_address, metrics=None, parent=None):
+        super().__init__(sock, metrics, parent)
+        self.udp = udp_transport.UdpFrameReceiver(sock, sender_address)
+        self._lost_reported = 0
+
+    def run(self):
+        self.native_id = threading.get_native_id()  # lets profilers attribute this thread's CPU time
+        while self._running:
+            try:
+                latest = self.udp.read_frame(timeout=0.5)
+                if latest is not None:
+                    header, payload = latest
+                    self.frames_received += 1
+                    self.feedback.on_frame(header.timestamp)
+                lost = self.udp.frames_lost - self._lost_reported
+                if lost:
+                    self._lost_reported += lost
+                    self.frames_dropped += lost
+                    self.feedback.on_dropped(lost)
+                self._send_feedback()
+                if latest is None:
+                    continue
+
+                started = time.perf_counter()
+                frame = self.udp.decode(header, payload)
+                if header.codec == frame_protocol.CODEC_RAW:
+                    frame = frame.copy()  # the decoder reuses its raw buffer
+                if self.metrics is not None:
+                    self.metrics.record("remote", "decode", time.perf_counter() - started)
+                    self.metrics.record("remote", "transit", max(0.0, time.time() - header.timestamp))
+            except (OSError, frame_protocol.ProtocolError) as e:
+                if self._running:
+                    self.stream_closed.emit(str(e))
+                return
+
+            self._deliver(header, frame)
+
+    def _send_feedback(self):
+        report = self.feedback.report()
+        if report is not None:
+            self.udp.send_feedback(report)
+
+
+class CameraTile(QFrame):
+    """One camera in the local mosaic: its capture engine, display, snapshots and recorder.
+
+    Every camera captures on its own thread and is opened in the background,
+    so a slow or stalled device only freezes its own tile.
+    """
+
+    def __init__(self, device, metrics, capture_factory=cv2.VideoCapture,
+                 pretrigger_seconds=2.0, capture_size=(640, 480), parent=None):
+        super().__init__(parent)
+        self.device = device
+        self.name = f"cam{device}"
+        self.engine = CaptureEngine(device, width=capture_size[0], height=capture_size[1],
+                                    capture_factory=capture_factory,
+                                    metrics=metrics, stream_name=self.name)
+        self.snapshots = SnapshotService(os.path.join("captures", self.name),
+                                         pretrigger_seconds=pretrigger_seconds)
+        self.recorder = None  # SegmentedRecorder while this camera is recording
+        self.recording_file = None
+        self.last_fed_seq = -1
+        self.last_displayed_seq = -1
+        self.last_displayed_frame = None
+
+        self.setFrameShape(QFrame.StyledPanel)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(2, 2, 2, 2)
+        layout.setSpacing(2)
+
+        # Camera title, video and per-camera controls
+        self.title_label = QLabel(f"Camera {device} (opening...)")
+        self.video_widget = VideoWidget(metrics=metrics, stream_name=self.name)
+        self.video_widget.setMinimumSize(160, 120)
+        self.snapshot_btn = QPushButton("Snapshot")
+        self.record_btn = QPushButton("Record")
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.snapshot_btn)
+        buttons_layout.addWidget(self.record_btn)
+
+        layout.addWidget(self.title_label)
+        layout.addWidget(self.video_widget, 1)
+        layout.addLayout(buttons_layout)
+
+    def start(self):
+        """Starts capturing; the device is opened on the capture thread."""
+        self.engine.start(background_open=True)
+
+    def poll(self):
+        """Feeds new frames to the recorder and snapshots. Returns the newest frame not yet shown."""
+        for entry in self.engine.frames_since(self.last_fed_seq):
+            if self.recorder is not None:
+                if entry.seq > self.last_fed_seq + 1:
+                    # Frames fell out of the ring buffer before we got to them
+                    self.recorder.note_dropped(entry.seq - self.last_fed_seq - 1)
+                self.recorder.submit(entry.frame, entry.timestamp)
+            self.snapshots.feed(entry)
+            self.last_fed_seq = entry.seq
+
+        latest = self.engine.latest()
+        if latest is None or latest.seq == self.last_displayed_seq:
+            return None
+        if self.last_displayed_seq < 0:
+            self.title_label.setText(f"Camera {self.device}")
+        self.last_displayed_seq = latest.seq
+        self.last_displayed_frame = latest
+        return latest
+
+    def snapshot(self):
+        """Saves the frame currently on screen. Returns a future, or None if nothing is shown."""
+        if self.last_displayed_frame is None:
+            return None
+        return self.snapshots.snapshot(self.last_displayed_frame)
+
+    def start_recording(self, directory, segment_seconds=60.0):
+        """Starts recording segments into `directory`. Returns False if the camera is not delivering frames."""
+        if self.recorder is not None or self.last_displayed_frame is None:
+            return False
+        # Segments are indexed by capture timestamp so playback can seek straight to a moment
+        self.recorder = SegmentedRecorder(directory, self.engine.frame_size, segment_seconds)
+        self.recorder.start()
+        self.recording_file = directory
+        self.record_btn.setText("Stop")
+        print(f"Started recording: {directory}")
+        return True
+
+    def stop_recording(self, wait=True):
+        """Stops recording and reports what was written, or leaves the rest to finish in the background."""
+        if self.recorder is None:
+            return
+        written, dropped, fps = self.recorder.stop(wait)
+        if self.recorder.error:
+            print(self.recorder.error)
+        if wait:
+            print(f"Recording saved: {self.recording_file} ({written} frames in "
+                  f"{len(self.recorder.segments)} segments at {fps or 0:.1f} fps, {dropped} dropped)")
+        else:
+            print(f"Recording stopped: {self.recording_file} ({written} frames so far, "
+                  f"the rest are written in the background)")
+        self.recorder = None
+        self.recording_file = None
+        self.record_btn.setText("Record")
+
+    def stop(self):
+        """Stops recording and capture without waiting on a stuck device or pending writes."""
+        self.stop_recording(wait=False)
+        self.engine.stop(timeout=0.2)
+        self.snapshots.shutdown(wait=False)
+        self.video_widget.clear()
 
 
 class StreamingApp(QMainWindow):
-    def __init__(self):
+    devices_scanned = Signal(object)
+
+    def __init__(self, capture_factory=cv2.VideoCapture, capture_size=(640, 480)):
         super().__init__()
         self.setWindowTitle("Streaming App with Toolbar")
         self.setMinimumSize(800, 600)
@@ -26,34 +303,61 @@ class StreamingApp(QMainWindow):
 
         # Network variables
         self.network_stream_socket = None
-        self.capture = None
+        self.remote_receiver = None
+
+        # Local cameras, one CameraTile per running device
+        self.capture_factory = capture_factory
+        self.capture_size = capture_size
+        self.device_scanner = DeviceScanner(capture_factory=capture_factory)
+        self.camera_tiles = {}
+        self.finishing_recorders = []  # recorders of removed tiles still writing their queued frames
         self.frame_counter = 0
-        self.out = None  # VideoWriter object for recording
+        self.burst_length = 10
+        self.pretrigger_seconds = 2.0
+        self.metrics = StreamMetrics()
+
+        # Playback of segmented recordings
+        self.playback_recording = None
+        self.playback_position = None  # (segment, index) of the frame shown
+        self.playback_timestamp = 0.0
+        self.playback_clock = None  # (monotonic time, recording time) when playback started
 
         # Create dock widgets for local and remote streams
         self.create_local_stream_dock()
         self.create_remote_stream_dock()
 
+        self.create_metrics_dock()
+        self.create_playback_dock()
+
         # Add a toolbar on the left for general functionalities
         self.create_toolbar()
 
+        # Probe cameras in the background; the list fills in when the scan finishes
+        self.devices_scanned.connect(self.update_device_list)
+        self.rescan_devices()
+
     def create_local_stream_dock(self):
-        """Creates a dock widget for the local video stream and controls."""
+        """Creates a dock widget for the local camera mosaic and controls."""
         local_widget = QWidget()
         local_layout = QVBoxLayout(local_widget)
         local_layout.setContentsMargins(5, 5, 5, 5)
         local_layout.setSpacing(5)
 
-        # Local video display
-        self.local_video_label = QLabel()
-        self.local_video_label.setStyleSheet("background-color: black;")
-        self.local_video_label.setMinimumSize(320, 240)
-        self.local_video_label.setScaledContents(True)
+        # Mosaic of camera tiles
+        mosaic_widget = QWidget()
+        mosaic_widget.setMinimumSize(320, 240)
+        self.mosaic_layout = QGridLayout(mosaic_widget)
+        self.mosaic_layout.setContentsMargins(0, 0, 0, 0)
+        self.mosaic_layout.setSpacing(2)
 
-        # USB Device dropdown
+        # USB device list, filled in by the background scan
         usb_label = QLabel("USB Devices:")
-        self.usb_dropdown = QComboBox()
-        self.usb_dropdown.addItems(["Device 0", "Device 1", "Device 2"])
+        self.device_list = QListWidget()
+        self.device_list.setMaximumHeight(80)
+        self.device_list.addItem("Scanning...")
+        self.device_list.itemChanged.connect(self.on_device_toggled)
+        self.rescan_btn = QPushButton("Rescan")
+        self.rescan_btn.clicked.connect(self.rescan_devices)
 
         # Local stream toggle button
         self.local_stream_btn = QPushButton("Start Stream")
@@ -62,13 +366,14 @@ class StreamingApp(QMainWindow):
         # Layout for USB controls
         usb_layout = QHBoxLayout()
         usb_layout.addWidget(usb_label)
-        usb_layout.addWidget(self.usb_dropdown)
+        usb_layout.addWidget(self.device_list, 1)
+        usb_layout.addWidget(self.rescan_btn)
 
         controls_layout = QHBoxLayout()
         controls_layout.addWidget(self.local_stream_btn)
 
         # Add all components to the local layout
-        local_layout.addWidget(self.local_video_label)
+        local_layout.addWidget(mosaic_widget, 1)
         local_layout.addLayout(usb_layout)
         local_layout.addLayout(controls_layout)
 
@@ -86,15 +391,14 @@ class StreamingApp(QMainWindow):
         remote_layout.setSpacing(5)
 
         # Remote video display
-        self.remote_video_label = QLabel()
-        self.remote_video_label.setStyleSheet("background-color: black;")
-        self.remote_video_label.setMinimumSize(320, 240)
-        self.remote_video_label.setScaledContents(True)
+        self.remote_video_widget = VideoWidget(metrics=self.metrics, stream_name="remote")
 
         # Network IP Address input
         ip_label = QLabel("IP Address:")
         self.remote_ip_input = QLineEdit()
-        self.remote_ip_input.setPlaceholderText("Enter server IP")
+        self.remote_ip_input.setPlaceholderText("Enter server IP[:port]")
+        self.remote_udp_checkbox = QCheckBox("UDP")
+        self.remote_udp_checkbox.setToolTip("Receive datagrams: lost packets drop a frame instead of stalling the stream")
 
         # Remote stream toggle button
         self.remote_stream_btn = QPushButton("Start Stream")
@@ -104,12 +408,13 @@ class StreamingApp(QMainWindow):
         network_layout = QHBoxLayout()
         network_layout.addWidget(ip_label)
         network_layout.addWidget(self.remote_ip_input)
+        network_layout.addWidget(self.remote_udp_checkbox)
 
         controls_layout = QHBoxLayout()
         controls_layout.addWidget(self.remote_stream_btn)
 
         # Add all components to the remote layout
-        remote_layout.addWidget(self.remote_video_label)
+        remote_layout.addWidget(self.remote_video_widget)
         remote_layout.addLayout(network_layout)
         remote_layout.addLayout(controls_layout)
 
@@ -119,6 +424,66 @@ class StreamingApp(QMainWindow):
         remote_dock.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.TopDockWidgetArea)
         self.addDockWidget(Qt.TopDockWidgetArea, remote_dock)
 
+    def create_metrics_dock(self):
+        """Creates a hidden dock widget showing per-stage latency and FPS."""
+        self.metrics_label = QLabel()
+        self.metrics_label.setStyleSheet("font-family: monospace;")
+        self.metrics_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+
+        self.metrics_dock = QDockWidget("Stream Metrics", self)
+        self.metrics_dock.setWidget(self.metrics_label)
+        self.metrics_dock.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.BottomDockWidgetArea)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.metrics_dock)
+        self.metrics_dock.hide()
+
+        # Refresh the text once a second while the dock is visible
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics_view)
+        self.metrics_timer.start(1000)
+
+    def create_playback_dock(self):
+        """Creates a hidden dock widget for playing back segmented recordings."""
+        playback_widget = QWidget()
+        playback_layout = QVBoxLayout(playback_widget)
+        playback_layout.setContentsMargins(5, 5, 5, 5)
+        playback_layout.setSpacing(5)
+
+        # Playback display and position
+        self.playback_video_widget = VideoWidget()
+        self.playback_slider = QSlider(Qt.Horizontal)
+        self.playback_slider.setEnabled(False)
+        self.playback_slider.valueChanged.connect(self.on_playback_slider_moved)
+        self.playback_time_label = QLabel("No recording loaded")
+
+        # Playback controls
+        open_btn = QPushButton("Open...")
+        open_btn.clicked.connect(self.open_recording)
+        self.playback_play_btn = QPushButton("Play")
+        self.playback_play_btn.clicked.connect(self.toggle_playback)
+        self.playback_goto_input = QLineEdit()
+        self.playback_goto_input.setPlaceholderText("Go to HH:MM:SS or +seconds")
+        self.playback_goto_input.returnPressed.connect(self.goto_playback_time)
+
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(open_btn)
+        controls_layout.addWidget(self.playback_play_btn)
+        controls_layout.addWidget(self.playback_goto_input)
+
+        playback_layout.addWidget(self.playback_video_widget, 1)
+        playback_layout.addWidget(self.playback_slider)
+        playback_layout.addWidget(self.playback_time_label)
+        playback_layout.addLayout(controls_layout)
+
+        self.playback_dock = QDockWidget("Playback", self)
+        self.playback_dock.setWidget(playback_widget)
+        self.playback_dock.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.BottomDockWidgetArea)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.playback_dock)
+        self.playback_dock.hide()
+
+        # Advances playback in real time while playing
+        self.playback_timer = QTimer(self)
+        self.playback_timer.timeout.connect(self.advance_playback)
+
     def create_toolbar(self):
         """Creates a toolbar on the left side for general functionalities."""
         toolbar = QToolBar("General Controls")
@@ -132,14 +497,92 @@ class StreamingApp(QMainWindow):
         capture_action.setToolTip("Capture a still image")
         capture_action.triggered.connect(self.capture_image)
 
+        # Add burst actions
+        burst_action = QAction(QIcon.fromTheme("camera-photo"), "Burst", self)
+        burst_action.setToolTip(f"Save the next {self.burst_length} frames")
+        burst_action.triggered.connect(self.capture_burst)
+
+        pretrigger_action = QAction(QIcon.fromTheme("document-save"), "Save Last Seconds", self)
+        pretrigger_action.setToolTip(f"Save the last {self.pretrigger_seconds:g} seconds of frames")
+        pretrigger_action.triggered.connect(self.save_pretrigger)
+
         # Add recording toggle button
         self.record_action = QAction(QIcon.fromTheme("media-record"), "Start Recording", self)
-        self.record_action.setToolTip("Start or stop recording the stream")
+        self.record_action.setToolTip("Start or stop recording every camera")
         self.record_action.triggered.connect(self.toggle_recording)
 
+        # Add metrics actions
+        metrics_action = self.metrics_dock.toggleViewAction()
+        metrics_action.setIcon(QIcon.fromTheme("utilities-system-monitor"))
+        metrics_action.setText("Metrics")
+        metrics_action.setToolTip("Show per-stage latency and FPS")
+
+        # Add playback action
+        playback_action = self.playback_dock.toggleViewAction()
+        playback_action.setIcon(QIcon.fromTheme("media-playback-start"))
+        playback_action.setText("Playback")
+        playback_action.setToolTip("Play back and seek through recordings")
+
+        export_metrics_action = QAction(QIcon.fromTheme("document-save-as"), "Export Metrics", self)
+        export_metrics_action.setToolTip("Save the current metrics as JSON and CSV")
+        export_metrics_action.triggered.connect(self.export_metrics)
+
         # Add actions to the toolbar
         toolbar.addAction(capture_action)
+        toolbar.addAction(burst_action)
+        toolbar.addAction(pretrigger_action)
         toolbar.addAction(self.record_action)
+        toolbar.addAction(playback_action)
+        toolbar.addAction(metrics_action)
+        toolbar.addAction(export_metrics_action)
+
+    def rescan_devices(self):
+        """Probes USB cameras on a background thread, leaving running cameras alone."""
+        if self.device_scanner.scan(self.devices_scanned.emit, in_use=self.camera_tiles):
+            self.rescan_btn.setEnabled(False)
+
+    def update_device_list(self, devices):
+        """Fills the device list from a finished scan, keeping the current selection."""
+        checked = self.checked_devices()
+        listed = any(self.device_list.item(row).data(Qt.UserRole) is not None
+                     for row in range(self.device_list.count()))
+        if not listed and devices:
+            # Preselect the first camera the first time any are found
+            checked = {min(devices)}
+
+        self.device_list.blockSignals(True)
+        self.device_list.clear()
+        for index, (width, height) in devices.items():
+            label = f"Device {index}" + (f" ({width}x{height})" if width and height else "")
+            item = QListWidgetItem(label)
+            item.setData(Qt.UserRole, index)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if index in checked else Qt.Unchecked)
+            self.device_list.addItem(item)
+        if not devices:
+            self.device_list.addItem("No cameras found")
+        self.device_list.blockSignals(False)
+        self.rescan_btn.setEnabled(True)
+        print(f"Found {len(devices)} camera(s): {', '.join(map(str, devices)) or 'none'}")
+
+    def checked_devices(self):
+        """Returns the set of device indices ticked in the device list."""
+        devices = set()
+        for row in range(self.device_list.count()):
+            item = self.device_list.item(row)
+            if item.data(Qt.UserRole) is not None and item.checkState() == Qt.Checked:
+                devices.add(item.data(Qt.UserRole))
+        return devices
+
+    def on_device_toggled(self, item):
+        """Starts or stops a camera when it is ticked while the stream is running."""
+        device = item.data(Qt.UserRole)
+        if not self.is_local_streaming or device is None:
+            return
+        if item.checkState() == Qt.Checked:
+            self.add_camera(device)
+        else:
+            self.remove_camera(device)
 
     def toggle_local_stream(self):
         """Toggles the local streaming state."""
@@ -149,52 +592,92 @@ class StreamingApp(QMainWindow):
             self.start_usb_stream()
 
     def start_usb_stream(self):
-        """Starts the USB stream."""
-        device_index = self.usb_dropdown.currentIndex()
-        self.capture = cv2.VideoCapture(device_index)
-
-        if not self.capture.isOpened():
-            print("Failed to open USB device.")
+        """Starts one capture worker per selected USB camera."""
+        devices = self.checked_devices()
+        if not devices:
+            print("Select at least one USB device.")
             return
 
+        for device in sorted(devices):
+            self.add_camera(device)
+
         print("USB stream started")
         self.is_local_streaming = True
         self.local_stream_btn.setText("Stop Stream")
 
-        # Start timer to update frames
+        # Each engine captures at its camera's own rate; the timer only refreshes the display
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_local_frame)
         self.timer.start(30)
 
+    def add_camera(self, device):
+        """Adds a tile for `device` to the mosaic and starts capturing from it."""
+        if device in self.camera_tiles:
+            return
+        tile = CameraTile(device, self.metrics, self.capture_factory, self.pretrigger_seconds,
+                          self.capture_size)
+        tile.snapshot_btn.clicked.connect(lambda: self.capture_camera_image(tile))
+        tile.record_btn.clicked.connect(lambda: self.toggle_camera_recording(tile))
+        tile.start()
+        self.camera_tiles[device] = tile
+        self.layout_mosaic()
+
+    def remove_camera(self, device):
+        """Stops `device` and removes its tile from the mosaic."""
+        tile = self.camera_tiles.pop(device, None)
+        if tile is None:
+            return
+        recorder = tile.recorder
+        tile.stop()
+        if recorder is not None:
+            self.finishing_recorders = [r for r in self.finishing_recorders if not r.wait(0)]
+            self.finishing_recorders.append(recorder)
+        self.mosaic_layout.removeWidget(tile)
+        tile.deleteLater()
+        self.layout_mosaic()
+        self.update_recording_state()
+
+    def layout_mosaic(self):
+        """Arranges the camera tiles in a roughly square grid."""
+        tiles = [self.camera_tiles[device] for device in sorted(self.camera_tiles)]
+        columns = max(1, math.ceil(math.sqrt(len(tiles))))
+        for tile in tiles:
+            self.mosaic_layout.removeWidget(tile)
+        for i, tile in enumerate(tiles):
+            self.mosaic_layout.addWidget(tile, i // columns, i % columns)
+
     def update_local_frame(self):
-        """Updates the frame from the USB stream."""
-        if self.capture:
-            ret, frame = self.capture.read()
-            if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = frame.shape
-                bytes_per_line = ch * w
-                qt_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.local_video_label.setPixmap(QPixmap.fromImage(qt_image))
-
-                # If recording, write the frame to the video file
-                if self.is_recording and hasattr(self, 'out'):
-                    self.out.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        """Shows each camera's newest frame and records any frames not yet written."""
+        for device, tile in list(self.camera_tiles.items()):
+            if not tile.engine.is_running:
+                # Only this camera is affected; the others keep streaming
+                print(tile.engine.error or f"Camera {device} stream ended.")
+                self.remove_camera(device)
+                continue
+            latest = tile.poll()
+            if latest is not None:
+                self.show_frame(tile.video_widget, tile.name, latest.frame, latest.timestamp)
+
+        if not self.camera_tiles:
+            self.stop_local_stream()
+
+    def show_frame(self, widget, stream, frame, timestamp):
+        """Hands a BGR frame to a video widget and records its end-to-end latency."""
+        widget.set_frame(frame)
+        self.metrics.record(stream, "latency", max(0.0, time.time() - timestamp))
+        self.metrics.tick(stream)
 
     def stop_local_stream(self):
-        """Stops the local stream."""
+        """Stops every local camera."""
         print("Local stream stopped")
         self.is_local_streaming = False
         self.local_stream_btn.setText("Start Stream")
 
-        if self.capture:
-            self.capture.release()
-            self.capture = None
-
         if hasattr(self, "timer"):
             self.timer.stop()
 
-        self.local_video_label.clear()
+        for device in list(self.camera_tiles):
+            self.remove_camera(device)
 
     def toggle_remote_stream(self):
         """Toggles the remote streaming state."""
@@ -209,102 +692,277 @@ class StreamingApp(QMainWindow):
         if not ip_address:
             print("Please enter a valid IP address.")
             return
-
-        self.network_stream_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # An optional ":port" suffix reaches senders that don't use the default port
+        port = frame_protocol.DEFAULT_PORT
+        if ip_address.count(":") == 1:
+            ip_address, port_text = ip_address.split(":")
+            if not port_text.isdigit():
+                print("Please enter a valid port.")
+                return
+            port = int(port_text)
+
+        use_udp = self.remote_udp_checkbox.isChecked()
         try:
-            self.network_stream_socket.connect((ip_address, 9999))
-            print("Remote stream started")
-            self.is_remote_streaming = True
-            self.remote_stream_btn.setText("Stop Stream")
-
-            # Start timer to update frames
-            self.remote_timer = QTimer(self)
-            self.remote_timer.timeout.connect(self.update_remote_frame)
-            self.remote_timer.start(30)
+            if use_udp:
+                self.network_stream_socket, sender_address = udp_transport.open_receiver(ip_address, port)
+            else:
+                self.network_stream_socket = frame_protocol.connect(ip_address, port)
         except Exception as e:
             print(f"Failed to connect to server: {e}")
+            return
+
+        print("Remote stream started" + (" over UDP" if use_udp else ""))
+        self.is_remote_streaming = True
+        self.remote_stream_btn.setText("Stop Stream")
+        self.remote_udp_checkbox.setEnabled(False)
+
+        # Receive frames on a worker thread, newest frame wins
+        if use_udp:
+            self.remote_receiver = UdpStreamReceiver(self.network_stream_socket, sender_address,
+                                                     self.metrics, self)
+        else:
+            self.remote_receiver = RemoteStreamReceiver(self.network_stream_socket, self.metrics, self)
+        self.remote_receiver.frame_ready.connect(self.update_remote_frame)
+        self.remote_receiver.stream_closed.connect(self.on_remote_stream_closed)
+        self.remote_receiver.start()
 
     def update_remote_frame(self):
-        """Updates the frame from the network stream on the remote side."""
-        try:
-            data = b""
-            while len(data) < struct.calcsize("Q"):
-                packet = self.network_stream_socket.recv(4 * 1024)
-                if not packet:
-                    return
-                data += packet
-
-            packed_msg_size = data[:struct.calcsize("Q")]
-            data = data[struct.calcsize("Q"):]
-            msg_size = struct.unpack("Q", packed_msg_size)[0]
-
-            while len(data) < msg_size:
-                data += self.network_stream_socket.recv(4 * 1024)
-
-            frame_data = data[:msg_size]
-            frame = pickle.loads(frame_data)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = frame.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            self.remote_video_label.setPixmap(QPixmap.fromImage(qt_image))
-        except Exception as e:
-            print(f"Error receiving remote frame: {e}")
+        """Displays the newest frame delivered by the remote receiver."""
+        if not self.remote_receiver:
+            return
+        latest = self.remote_receiver.take_frame()
+        if latest is None:
+            return
+
+        header, frame = latest
+        self.show_frame(self.remote_video_widget, "remote", frame, header.timestamp)
+
+    def on_remote_stream_closed(self, reason):
+        """Handles the receiver losing its connection."""
+        print(f"Remote stream closed: {reason}")
+        if self.is_remote_streaming:
+            self.stop_remote_stream()
 
     def stop_remote_stream(self):
         """Stops the remote stream."""
         print("Remote stream stopped")
         self.is_remote_streaming = False
         self.remote_stream_btn.setText("Start Stream")
+        self.remote_udp_checkbox.setEnabled(True)
+
+        if self.remote_receiver:
+            self.remote_receiver.stop()
+            print(f"Remote frames received: {self.remote_receiver.frames_received}, "
+                  f"dropped: {self.remote_receiver.frames_dropped}")
+            self.remote_receiver = None
 
         if self.network_stream_socket:
             self.network_stream_socket.close()
             self.network_stream_socket = None
 
-        if hasattr(self, "remote_timer"):
-            self.remote_timer.stop()
-
-        self.remote_video_label.clear()
+        self.remote_video_widget.clear()
 
     def capture_image(self):
-        """Captures a still image from the local video stream."""
-        if self.capture and self.is_local_streaming:
-            ret, frame = self.capture.read()
-            if ret:
-                os.makedirs("captures", exist_ok=True)
-                filename = f"captures/capture_{self.frame_counter}.png"
-                cv2.imwrite(filename, frame)
-                print(f"Image saved: {filename}")
-                self.frame_counter += 1
+        """Saves the frame each camera is showing; encoding happens off the GUI thread."""
+        for tile in self.camera_tiles.values():
+            self.capture_camera_image(tile)
+
+    def capture_camera_image(self, tile):
+        """Saves the frame one camera is showing."""
+        future = tile.snapshot()
+        if future is not None:
+            future.add_done_callback(self._report_saved)
+
+    def capture_burst(self):
+        """Saves the next few captured frames of every camera."""
+        for tile in self.camera_tiles.values():
+            directory = tile.snapshots.start_burst(self.burst_length)
+            print(f"Burst of {self.burst_length} frames started: {directory}")
+
+    def save_pretrigger(self):
+        """Saves the frames every camera captured during the last few seconds."""
+        for tile in self.camera_tiles.values():
+            directory, count = tile.snapshots.save_pretrigger()
+            print(f"Saving {count} buffered frames to {directory}")
+
+    @staticmethod
+    def _report_saved(future):
+        if future.exception():
+            print(f"Failed to save image: {future.exception()}")
+        else:
+            print(f"Image saved: {future.result()}")
 
     def toggle_recording(self):
-        """Toggles between start and stop recording."""
+        """Starts recording every camera, or stops all recordings if any is running."""
         if self.is_recording:
-            # Stop recording
-            self.is_recording = False
-            self.record_action.setText("Start Recording")
-            if hasattr(self, 'out'):
-                self.out.release()
-                print(f"Recording saved: recordings/recording_{self.frame_counter}.avi")
+            for tile in self.camera_tiles.values():
+                tile.stop_recording()
+        else:
+            # Ensure the recordings directory exists
+            os.makedirs("recordings", exist_ok=True)
+            started = False
+            for device in sorted(self.camera_tiles):
+                tile = self.camera_tiles[device]
+                started = tile.start_recording(self.recording_filename(tile)) or started
+            if started:
                 self.frame_counter += 1  # Increment frame counter for the next recording
+        self.update_recording_state()
+
+    def toggle_camera_recording(self, tile):
+        """Starts or stops recording a single camera."""
+        if tile.recorder is not None:
+            tile.stop_recording()
         else:
-            # Start recording
-            if self.capture and self.capture.isOpened():
-                # Ensure the recordings directory exists
-                os.makedirs("recordings", exist_ok=True)
-
-                # Define the filename for the recording
-                filename = f"recordings/recording_{self.frame_counter}.avi"
-
-                # Initialize the VideoWriter
-                fourcc = cv2.VideoWriter_fourcc(*'XVID')
-                frame_width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-                frame_height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                self.out = cv2.VideoWriter(filename, fourcc, 20.0, (frame_width, frame_height))
-
-                self.record_action.setText("Stop Recording")
-                self.is_recording = True
-                print(f"Started recording: {filename}")
+            os.makedirs("recordings", exist_ok=True)
+            if tile.start_recording(self.recording_filename(tile)):
+                self.frame_counter += 1
+        self.update_recording_state()
+
+    def recording_filename(self, tile):
+        return f"recordings/recording_{tile.name}_{self.frame_counter}"
+
+    def update_recording_state(self):
+        """Keeps the toolbar's record action in step with the cameras."""
+        self.is_recording = any(tile.recorder is not None for tile in self.camera_tiles.values())
+        self.record_action.setText("Stop Recording" if self.is_recording else "Start Recording")
+
+    def open_recording(self):
+        """Asks for a recording directory and loads it into the playback dock."""
+        directory = QFileDialog.getExistingDirectory(self, "Open Recording", "recordings")
+        if directory:
+            self.load_recording(directory)
+
+    def load_recording(self, directory):
+        """Loads a segmented recording and shows its first frame."""
+        self.close_recording()
+        try:
+            self.playback_recording = Recording(directory)
+        except (OSError, ValueError) as e:
+            print(f"Failed to open recording: {e}")
+            return
+
+        recording = self.playback_recording
+        print(f"Loaded {directory}: {recording.frame_count} frames in {len(recording.segments)} segments")
+        self.playback_slider.setRange(0, int((recording.end_time - recording.start_time) * 1000))
+        self.playback_slider.setEnabled(True)
+        self.playback_dock.show()
+        self.seek_playback(recording.start_time)
+
+    def close_recording(self):
+        """Stops playback and releases the loaded recording."""
+        if self.playback_timer.isActive():
+            self.toggle_playback()
+        if self.playback_recording is not None:
+            self.playback_recording.close()
+            self.playback_recording = None
+            self.playback_position = None
+            self.playback_slider.setEnabled(False)
+            self.playback_time_label.setText("No recording loaded")
+            self.playback_video_widget.clear()
+
+    def seek_playback(self, timestamp):
+        """Shows the frame captured at or just before `timestamp`; only that frame is decoded."""
+        if self.playback_recording is None:
+            return
+        self.show_playback_frame(self.playback_recording.locate(timestamp))
+        if self.playback_timer.isActive():
+            self.playback_clock = (time.monotonic(), self.playback_timestamp)
+
+    def show_playback_frame(self, position):
+        """Decodes and displays the frame at (segment, index)."""
+        if position == self.playback_position:
+            return
+        recording = self.playback_recording
+        try:
+            timestamp, frame = recording.read(*position)
+        except ValueError as e:
+            print(e)
+            return
+        self.playback_position = position
+        self.playback_timestamp = timestamp
+        self.playback_video_widget.set_frame(frame)
+
+        millis = int((timestamp % 1) * 1000)
+        self.playback_time_label.setText(
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}.{millis:03d}  "
+            f"(+{timestamp - recording.start_time:.1f} s, segment {position[0]})")
+        self.playback_slider.blockSignals(True)
+        self.playback_slider.setValue(int((timestamp - recording.start_time) * 1000))
+        self.playback_slider.blockSignals(False)
+
+    def on_playback_slider_moved(self, value):
+        if self.playback_recording is not None:
+            self.seek_playback(self.playback_recording.start_time + value / 1000)
+
+    def goto_playback_time(self):
+        """Seeks to a wall-clock time (HH:MM:SS) or an offset from the start (+seconds)."""
+        recording = self.playback_recording
+        text = self.playback_goto_input.text().strip()
+        if recording is None or not text:
+            return
+        try:
+            if text.startswith("+"):
+                timestamp = recording.start_time + float(text[1:])
+            else:
+                parts = [float(part) for part in text.split(":")]
+                hours, minutes, seconds = (parts + [0.0, 0.0])[:3]
+                day = time.localtime(recording.start_time)
+                timestamp = time.mktime((day.tm_year, day.tm_mon, day.tm_mday, int(hours), int(minutes),
+                                         0, 0, 0, -1)) + seconds
+                if timestamp < recording.start_time - 12 * 3600:
+                    timestamp += 24 * 3600  # the recording ran past midnight
+        except ValueError:
+            print(f"Not a time: {text}")
+            return
+        self.seek_playback(timestamp)
+
+    def toggle_playback(self):
+        """Plays or pauses the loaded recording."""
+        if self.playback_timer.isActive():
+            self.playback_timer.stop()
+            self.playback_play_btn.setText("Play")
+        elif self.playback_recording is not None:
+            if self.playback_timestamp >= self.playback_recording.end_time:
+                self.seek_playback(self.playback_recording.start_time)
+            self.playback_clock = (time.monotonic(), self.playback_timestamp)
+            self.playback_timer.start(15)
+            self.playback_play_btn.setText("Pause")
+
+    def advance_playback(self):
+        """Shows the frame due at the current playback time, skipping any in between."""
+        started, timestamp = self.playback_clock
+        target = timestamp + time.monotonic() - started
+        self.show_playback_frame(self.playback_recording.locate(target))
+        if target >= self.playback_recording.end_time:
+            self.toggle_playback()
+
+    def update_metrics_view(self):
+        """Refreshes the metrics dock if it is visible."""
+        if self.metrics_dock.isVisible():
+            self.metrics_label.setText(self.metrics.format_text() or "No frames yet")
+
+    def export_metrics(self):
+        """Saves the current metrics snapshot as JSON and CSV."""
+        os.makedirs("metrics", exist_ok=True)
+        base = f"metrics/metrics_{time.strftime('%Y%m%d-%H%M%S')}"
+        self.metrics.export_json(base + ".json")
+        self.metrics.export_csv(base + ".csv")
+        print(f"Metrics saved: {base}.json, {base}.csv")
+
+    def closeEvent(self, event):
+        """Stops worker threads before the window goes away."""
+        if self.is_remote_streaming:
+            self.stop_remote_stream()
+        # Recorder threads die with the interpreter, so flush every recording before exiting
+        for tile in self.camera_tiles.values():
+            tile.stop_recording()
+        if self.is_local_streaming:
+            self.stop_local_stream()
+        for recorder in self.finishing_recorders:
+            recorder.wait()
+        self.finishing_recorders = []
+        self.close_recording()
+        super().closeEvent(event)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+"""Per-stage timing and frame rate metrics for the streaming pipeline.
+
+Stages report durations in seconds with `record`, streams report shown
+frames with `tick`. Only the most recent samples are kept, so percentiles
+and frame rates describe the last few seconds rather than the whole run.
+"""
+import csv
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+
+def percentile(sorted_values, fraction):
+    """Returns the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class StreamMetrics:
+    """Rolling stage histograms and FPS counters, safe to update from any thread."""
+
+    def __init__(self, window=300, fps_window=2.0):
+        self.window = window
+        self.fps_window = fps_window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._frames = defaultdict(deque)
+        self._counts = defaultdict(int)
+
+    def record(self, stream, stage, seconds):
+        """Adds one duration sample for `stage` of `stream`."""
+        with self._lock:
+            self._samples[(stream, stage)].append(seconds)
+            self._counts[(stream, stage)] += 1
+
+    def tick(self, stream, now=None):
+        """Notes that `stream` produced a frame, for its FPS estimate."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            frames = self._frames[stream]
+            frames.append(now)
+            while frames and frames[0] < now - self.fps_window:
+                frames.popleft()
+
+    def fps(self, stream, now=None):
+        """Returns the recent frame rate of `stream`."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            frames = [t for t in self._frames.get(stream, ()) if t >= now - self.fps_window]
+        if len(frames) < 2:
+            return 0.0
+        span = frames[-1] - frames[0]
+        return (len(frames) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        """Returns {stream: {"fps": float, "stages": {stage: stats}}} with times in ms."""
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+            counts = dict(self._counts)
+            streams = set(self._frames) | {stream for stream, _ in samples}
+
+        result = {}
+        for stream in sorted(streams):
+            result[stream] = {"fps": round(self.fps(stream), 2), "stages": {}}
+        for (stream, stage), values in sorted(samples.items()):
+            result[stream]["stages"][stage] = {
+                "count": counts[(stream, stage)],
+                "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+                "p50_ms": round(1000 * percentile(values, 0.50), 3),
+                "p95_ms": round(1000 * percentile(values, 0.95), 3),
+                "p99_ms": round(1000 * percentile(values, 0.99), 3),
+            }
+        return result
+
+    def format_text(self):
+        """Renders the snapshot as a compact multi-line summary."""
+        lines = []
+        for stream, data in self.snapshot().items():
+            lines.append(f"{stream}: {data['fps']:.1f} fps")
+            for stage, stats in data["stages"].items():
+                lines.append(f"  {stage:<10} p50 {stats['p50_ms']:7.2f}  p95 {stats['p95_ms']:7.2f}  "
+                             f"p99 {stats['p99_ms']:7.2f} ms")
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        """Writes the current snapshot to a JSON file."""
+        with open(path, "w") as f:
+            json.dump({"timestamp": time.time(), "streams": self.snapshot()}, f, indent=2)
+
+    def export_csv(self, path):
+        """Writes the current snapshot to a CSV file, one row per stream and stage."""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stream", "stage", "fps", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+            for stream, data in self.snapshot().items():
+                for stage, stats in data["stages"].items():
+                    writer.writerow([stream, stage, data["fps"], stats["count"], stats["mean_ms"],
+                                     stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]])
@@ -0,0 +1,208 @@
+"""Reference sender for the remote stream.
+
+Serves frames from a camera (or a synthetic test pattern) to one
+`StreamingApp` client at a time using the protocol in frame_protocol.py,
+over TCP or, with --udp, as datagrams (see udp_transport.py).
+
+    python stream_sender.py --device 0
+    python stream_sender.py --synthetic --codec jpeg --quality 70
+    python stream_sender.py --synthetic --udp
+"""
+import argparse
+import select
+import socket
+import time
+
+import cv2
+
+import frame_protocol
+import udp_transport
+from adaptive_quality import QualityController, QualitySettings, apply_scale, capped_ladder
+from capture_engine import SyntheticCapture
+from change_gate import ChangeGate
+
+
+def open_source(args):
+    """Opens the camera, or a synthetic test pattern with --synthetic."""
+    if args.synthetic:
+        capture = SyntheticCapture(width=args.width, height=args.height, fps=args.fps)
+    else:
+        capture = cv2.VideoCapture(args.device)
+    if not capture.isOpened():
+        raise SystemExit(f"Failed to open camera {args.device}")
+    return capture
+
+
+def read_feedback(conn):
+    """Returns the next feedback report if one has arrived, without blocking."""
+    readable, _, _ = select.select([conn], [], [], 0)
+    if not readable:
+        return None
+    data = b""
+    while len(data) < frame_protocol.FEEDBACK.size:
+        chunk = conn.recv(frame_protocol.FEEDBACK.size - len(data))
+        if not chunk:
+            raise ConnectionError("Client closed the connection")
+        data += chunk
+    return frame_protocol.unpack_feedback(data)
+
+
+def new_controller(args):
+    """Returns a QualityController that never goes above --quality, or None with --fixed-quality."""
+    if args.fixed_quality:
+        return None
+    return QualityController(args.target_delay, capped_ladder(args.quality))
+
+
+def serve_client(conn, read, args):
+    """Streams frames to a single connected client until it disconnects."""
+    codec = frame_protocol.CODEC_NAMES[args.codec]
+    settings = QualitySettings(args.quality, 1.0, args.fps)
+    controller = new_controller(args)
+    gate = ChangeGate(args.change_threshold, keepalive=args.keepalive)
+    seq = 0
+    next_send = time.monotonic()
+    try:
+        while True:
+            ret, frame = read()
+            if not ret:
+                print("Camera read failed")
+                return
+
+            feedback = read_feedback(conn)
+            if feedback is not None and controller is not None:
+                settings = controller.update(feedback)
+
+            # Static scenes only get a keep-alive frame now and then
+            if gate.check(frame):
+                frame_protocol.send_frame(conn, apply_scale(frame, settings.scale), seq, codec,
+                                          settings.quality)
+                seq += 1
+            next_send = wait_for_next_frame(next_send, args.fps, settings.fps)
+    finally:
+        print(f"Change gate: {gate.summary()}")
+
+
+def wait_for_next_frame(next_send, max_fps, fps):
+    """Sleeps until the next frame is due and returns its send time."""
+    fps = min(max_fps, fps) if max_fps > 0 else fps
+    interval = 1.0 / fps if fps > 0 else 0.0
+    if not interval:
+        return next_send
+    next_send += interval
+    delay = next_send - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+        return next_send
+    return time.monotonic()
+
+
+def serve_udp(sock, read, args):
+    """Streams frames as datagrams to whichever receiver subscribed most recently."""
+    codec = frame_protocol.CODEC_NAMES[args.codec]
+    client = None
+    last_heard = 0.0
+    settings = controller = None
+    gate = ChangeGate(args.change_threshold, keepalive=args.keepalive)
+    frame_id = 0
+    next_send = time.monotonic()
+    while True:
+        # Handle subscriptions and feedback without blocking the stream
+        timeout = 0 if client is not None else 1.0
+        while select.select([sock], [], [], timeout)[0]:
+            timeout = 0
+            data, address = sock.recvfrom(udp_transport.MAX_DATAGRAM)
+            try:
+                feedback = udp_transport.parse_control(data)
+            except frame_protocol.ProtocolError:
+                continue
+            if address != client:
+                print(f"UDP client subscribed: {address}")
+                client = address
+                gate.reset()
+                settings = QualitySettings(args.quality, 1.0, args.fps)
+                controller = new_controller(args)
+            last_heard = time.monotonic()
+            if feedback is not None and controller is not None:
+                settings = controller.update(feedback)
+
+        if client is not None and time.monotonic() - last_heard > udp_transport.SUBSCRIBER_TIMEOUT:
+            print(f"UDP client timed out: {client} ({gate.summary()})")
+            client = None
+        if client is None:
+            continue
+
+        ret, frame = read()
+        if not ret:
+            print("Camera read failed")
+            return
+        if gate.check(frame):
+            udp_transport.send_frame(sock, client, apply_scale(frame, settings.scale), frame_id,
+                                     codec, settings.quality, mtu=args.mtu)
+            frame_id += 1
+        next_send = wait_for_next_frame(next_send, args.fps, settings.fps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reference sender for the remote stream.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=frame_protocol.DEFAULT_PORT)
+    parser.add_argument("--device", type=int, default=0)
+    parser.add_argument("--synthetic", action="store_true", help="send a test pattern instead of a camera")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--codec", choices=sorted(frame_protocol.CODEC_NAMES), default="jpeg")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--fixed-quality", action="store_true",
+                        help="ignore client feedback and always send full quality")
+    parser.add_argument("--target-delay", type=float, default=0.15)
+    parser.add_argument("--change-threshold", type=float, default=0.005,
+                        help="fraction of a thumbnail that must change before a frame is sent; 0 sends every frame")
+    parser.add_argument("--keepalive", type=float, default=0.5,
+                        help="longest time in seconds between frames while the scene is static")
+    parser.add_argument("--udp", action="store_true", help="send datagrams instead of a TCP stream")
+    parser.add_argument("--mtu", type=int, default=udp_transport.DEFAULT_MTU,
+                        help="largest datagram to send with --udp")
+    args = parser.parse_args()
+
+    capture = open_source(args)
+    if args.udp:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((args.host, args.port))
+        print(f"UDP sender listening on {args.host}:{args.port}")
+        try:
+            serve_udp(sock, capture.read, args)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            capture.release()
+        return
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((args.host, args.port))
+    server.listen(1)
+    print(f"Sender listening on {args.host}:{args.port}")
+
+    try:
+        while True:
+            conn, addr = server.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print(f"Client connected: {addr}")
+            try:
+                serve_client(conn, capture.read, args)
+            except OSError as e:
+                print(f"Client {addr} disconnected: {e}")
+            finally:
+                conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        capture.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""Multi-viewer stream server for the remote dock.
+
+Captures from one camera, encodes each frame once and fans the encoded
+bytes out to every connected `StreamingApp` client on port 9999. Each
+client has its own tiny send queue; when a client can't keep up, its stale
+frames are skipped so it never holds back the others. Clients that send
+feedback reports get their own JPEG quality, scale and frame rate from a
+QualityController; frames are encoded once per distinct setting. Viewers
+can also subscribe over UDP on the same port (see udp_transport.py). While
+the scene is static, a ChangeGate holds frames back before they are
+encoded, apart from a keep-alive.
+
+    python stream_server.py --device 0
+    python stream_server.py --synthetic
+    python stream_server.py --load-test 40 --slow-clients 5
+"""
+import argparse
+import asyncio
+import socket
+import struct
+import sys
+import time
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Windows: only the asyncio buffer is checked
+    fcntl = termios = None
+
+import cv2
+
+import frame_protocol
+import udp_transport
+from adaptive_quality import QualityController, QualitySettings, apply_scale, capped_ladder
+from capture_engine import CaptureEngine, SyntheticCapture
+from change_gate import ChangeGate
+from stream_metrics import StreamMetrics
+
+
+class ClientSession:
+    """Send queue and counters for one connected viewer."""
+
+    def __init__(self, writer, max_pending=1, metrics=None, settings=None, controller=None, peer=None):
+        self.writer = writer
+        self.metrics = metrics
+        self.peer = writer.get_extra_info("peername") if writer is not None else peer
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.settings = settings
+        self.controller = controller  # set when the client reports feedback
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        self.closed = False
+        self._skipped_reported = 0
+        self._next_frame = 0.0
+
+    def due(self, now):
+        """Returns True if the client's frame rate allows sending a frame at `now`."""
+        if now + 1e-3 < self._next_frame:
+            return False
+        self._next_frame = max(self._next_frame + 1.0 / self.settings.fps, now)
+        return True
+
+    def apply_feedback(self, feedback):
+        """Feeds a client report, plus frames we skipped for it, into the controller."""
+        if self.controller is None:
+            return
+        skipped = self.frames_skipped - self._skipped_reported
+        self._skipped_reported = self.frames_skipped
+        self.settings = self.controller.update(feedback._replace(dropped=feedback.dropped + skipped))
+
+    def offer(self, data):
+        """Queues an encoded frame, or skips it while the previous one is still on its way.
+
+        A frame written behind bytes the client hasn't taken yet would reach
+        it late, so a slow client gets the next frame after its buffers empty.
+        """
+        if self.closed:
+            return
+        if self.writer is not None and self.unsent_bytes() > 0:
+            self.frames_skipped += 1
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.frames_skipped += 1
+        self.queue.put_nowait(data)
+
+    def unsent_bytes(self):
+        """Returns the bytes still buffered in asyncio and, where the OS tells, unacknowledged in the kernel."""
+        size = self.writer.transport.get_write_buffer_size()
+        sock = self.writer.get_extra_info("socket")
+        if fcntl is not None and sock is not None:
+            try:
+                size += struct.unpack("i", fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, b"\0" * 4))[0]
+            except OSError:
+                pass
+        return size
+
+    def close(self):
+        """Asks `run` to finish once the current frame is out; later offers are ignored."""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def run(self):
+        """Sends queued frames until the client disconnects or the session is closed."""
+        while True:
+            data = await self.queue.get()
+            if data is None:
+                return
+            started = time.perf_counter()
+            self.writer.write(data)
+            await self.writer.drain()
+            if self.metrics is not None:
+                self.metrics.record("server", "send", time.perf_counter() - started)
+            self.frames_sent += 1
+            self.bytes_sent += len(data)
+
+
+class UdpClientSession(ClientSession):
+    """A viewer subscribed over UDP.
+
+    Frames are fragmented and handed straight to the datagram transport.
+    While the transport still has an earlier frame buffered, new frames are
+    skipped instead of queued.
+    """
+
+    def __init__(self, transport, peer, metrics=None, settings=None, controller=None,
+                 send_buffer=64 * 1024, mtu=udp_transport.DEFAULT_MTU):
+        super().__init__(None, metrics=metrics, settings=settings, controller=controller, peer=peer)
+        self.transport = transport
+        self.send_buffer = send_buffer
+        self.mtu = mtu
+        self.last_heard = time.monotonic()
+        self._frame_id = 0
+
+    def offer(self, data):
+        if self.transport.get_write_buffer_size() > self.send_buffer:
+            self.frames_skipped += 1
+            return
+        started = time.perf_counter()
+        for datagram in udp_transport.fragment(data, self._frame_id, self.mtu):
+            self.transport.sendto(datagram, self.peer)
+        if self.metrics is not None:
+            self.metrics.record("server", "send", time.perf_counter() - started)
+        self._frame_id += 1
+        self.frames_sent += 1
+        self.bytes_sent += len(data)
+
+    def close(self):
+        pass
+
+
+class _UdpEndpoint(asyncio.DatagramProtocol):
+    """Passes datagrams from UDP viewers to the server."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, address):
+        self.server._on_datagram(data, address)
+
+
+class StreamServer:
+    """Fans frames from one CaptureEngine out to many TCP clients."""
+
+    def __init__(self, engine, host="0.0.0.0", port=frame_protocol.DEFAULT_PORT,
+                 codec=frame_protocol.CODEC_JPEG, quality=80, max_pending=1,
+                 send_buffer=64 * 1024, metrics=None, adaptive=True, target_delay=0.15, udp=True,
+                 gate=None):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.codec = codec
+        self.quality = quality
+        self.max_pending = max_pending
+        self.send_buffer = send_buffer
+        self.metrics = metrics if metrics is not None else StreamMetrics()
+        self.adaptive = adaptive
+        self.target_delay = target_delay
+        self.udp = udp
+        self.gate = gate  # optional ChangeGate applied before encoding
+        self.clients = set()
+        self.udp_clients = {}
+        self._udp_transport = None
+        self.frames_encoded = 0
+        self.frames_skipped = 0
+        self._client_tasks = set()
+        self._server = None
+        self._broadcast_task = None
+
+    async def start(self):
+        """Starts listening and broadcasting. The engine must already be running."""
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.udp:
+            self._udp_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _UdpEndpoint(self), local_addr=(self.host, self.port))
+        self._broadcast_task = asyncio.create_task(self._broadcast_loop())
+        print(f"Stream server listening on {self.host}:{self.port}" + (" (TCP and UDP)" if self.udp else ""))
+
+    @property
+    def client_count(self):
+        """Number of connected TCP and UDP viewers; safe to read from other threads."""
+        return len(self.clients)
+
+    async def wait(self):
+        """Waits until broadcasting ends, e.g. because the camera stopped."""
+        await self._broadcast_task
+
+    async def stop(self):
+        """Stops broadcasting and disconnects every client."""
+        if self._broadcast_task:
+            self._broadcast_task.cancel()
+            await asyncio.gather(self._broadcast_task, return_exceptions=True)
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._udp_transport:
+            self._udp_transport.close()
+        for session in list(self.udp_clients.values()):
+            self._remove_udp_client(session)
+        for session in list(self.clients):
+            session.close()
+        await asyncio.gather(*self._client_tasks, return_exceptions=True)
+
+    def _encode(self, entry, quality, scale):
+        started = time.perf_counter()
+        frame = apply_scale(entry.frame, scale)
+        payload = frame_protocol.encode_frame(frame, self.codec, quality)
+        header = frame_protocol.pack_header(frame, self.codec, entry.seq,
+                                            entry.timestamp, len(payload))
+        self.metrics.record("server", "encode", time.perf_counter() - started)
+        return header + payload
+
+    async def _broadcast_loop(self):
+        loop = asyncio.get_running_loop()
+        last_seq = -1
+        while True:
+            entry = await loop.run_in_executor(None, self.engine.wait_for_frame, last_seq, 1.0)
+            if entry is None:
+                if not self.engine.is_running:
+                    print(self.engine.error or "Capture stopped")
+                    return
+                continue
+            last_seq = entry.seq
+            now = time.monotonic()
+            for session in list(self.udp_clients.values()):
+                if now - session.last_heard > udp_transport.SUBSCRIBER_TIMEOUT:
+                    self._remove_udp_client(session)
+            if not self.clients:
+                continue
+            if self.gate is not None:
+                started = time.perf_counter()
+                changed = self.gate.check(entry.frame)
+                self.metrics.record("server", "gate", time.perf_counter() - started)
+                if not changed:
+                    continue
+
+            # Encode once per distinct setting, off the event loop, and share the bytes
+            encoded = {}
+            for session in list(self.clients):
+                if not session.due(now):
+                    continue
+                key = (session.settings.quality, session.settings.scale)
+                if key not in encoded:
+                    encoded[key] = await loop.run_in_executor(None, self._encode, entry, *key)
+                    self.frames_encoded += 1
+                session.offer(encoded[key])
+            if encoded:
+                self.metrics.tick("server")
+
+    async def _handle_client(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Small kernel buffers keep a slow client from hoarding stale frames
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        writer.transport.set_write_buffer_limits(high=self.send_buffer)
+        settings = QualitySettings(self.quality, 1.0, 1000)
+        controller = self._new_controller()
+        session = ClientSession(writer, self.max_pending, self.metrics, settings, controller)
+        self.clients.add(session)
+        if self.gate is not None:
+            self.gate.reset()  # the new viewer needs a first frame now
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        feedback_task = asyncio.create_task(self._read_feedback(reader, session))
+        print(f"Client connected: {session.peer} ({len(self.clients)} total)")
+        try:
+            await session.run()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            feedback_task.cancel()
+            self.clients.discard(session)
+            self._client_tasks.discard(task)
+            self.frames_skipped += session.frames_skipped
+            writer.close()
+            print(f"Client disconnected: {session.peer} "
+                  f"(sent {session.frames_sent}, skipped {session.frames_skipped})")
+
+    def _new_controller(self):
+        """Returns a client's QualityController, starting at --quality and never going above it."""
+        if not self.adaptive:
+            return None
+        return QualityController(self.target_delay, capped_ladder(self.quality))
+
+    def _on_datagram(self, data, address):
+        """Handles a subscription or feedback report from a UDP viewer."""
+        try:
+            feedback = udp_transport.parse_control(data)
+        except frame_protocol.ProtocolError:
+            return
+        session = self.udp_clients.get(address)
+        if session is None:
+            settings = QualitySettings(self.quality, 1.0, 1000)
+            controller = self._new_controller()
+            session = UdpClientSession(self._udp_transport, address, self.metrics, settings,
+                                       controller, self.send_buffer)
+            self.udp_clients[address] = session
+            self.clients.add(session)
+            if self.gate is not None:
+                self.gate.reset()
+            print(f"UDP client subscribed: {address} ({len(self.clients)} total)")
+        session.last_heard = time.monotonic()
+        if feedback is not None:
+            session.apply_feedback(feedback)
+
+    def _remove_udp_client(self, session):
+        self.udp_clients.pop(session.peer, None)
+        self.clients.discard(session)
+        self.frames_skipped += session.frames_skipped
+        print(f"UDP client gone: {session.peer} "
+              f"(sent {session.frames_sent}, skipped {session.frames_skipped})")
+
+    async def _read_feedback(self, reader, session):
+        """Reads feedback reports from a client; its disconnect also ends the session."""
+        try:
+            while True:
+                data = await reader.readexactly(frame_protocol.FEEDBACK.size)
+                session.apply_feedback(frame_protocol.unpack_feedback(data))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, frame_protocol.ProtocolError):
+            session.close()
+
+
+async def _simulated_client(host, port, duration, read_delay, stats):
+    """Connects to the server and reads frames for `duration` seconds."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Model a constrained link rather than a large loopback receive buffer; a
+    # slow client's link is the bottleneck, so bytes queue at the sender
+    receive_buffer = 4 * 1024 if read_delay else 32 * 1024
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (host, port))
+    reader, writer = await asyncio.open_connection(sock=sock, limit=receive_buffer // 2)
+    frames = 0
+    latencies = []
+    deadline = time.monotonic() + duration
+    try:
+        while time.monotonic() < deadline:
+            header_bytes = await reader.readexactly(frame_protocol.HEADER.size)
+            header = frame_protocol.unpack_header(header_bytes)
+            await reader.readexactly(header.length)
+            latencies.append(time.time() - header.timestamp)
+            frames += 1
+            if read_delay:
+                await asyncio.sleep(read_delay)
+    finally:
+        writer.close()
+    stats.append((read_delay > 0, frames / duration, latencies))
+
+
+async def run_load_test(clients=40, slow_clients=5, duration=5.0, fps=30.0, slow_delay=0.2):
+    """Runs many simulated viewers against an in-process server over loopback.
+
+    Returns False if slow clients were sent stale frames, i.e. their p95
+    latency exceeds three of their own frame intervals.
+    """
+    engine = CaptureEngine(0, width=640, height=480, fps=fps,
+                           capture_factory=SyntheticCapture)
+    engine.start()
+    server = StreamServer(engine, host="127.0.0.1", port=0)
+    await server.start()
+
+    stats = []
+    tasks = [
+        _simulated_client("127.0.0.1", server.port, duration,
+                          slow_delay if i < slow_clients else 0.0, stats)
+        for i in range(clients)
+    ]
+    await asyncio.gather(*tasks)
+    await server.stop()
+    engine.stop()
+
+    ok = True
+    for slow, label in ((False, "fast"), (True, "slow")):
+        group = [s for s in stats if s[0] == slow]
+        if not group:
+            continue
+        rates = [s[1] for s in group]
+        latencies = sorted(l for s in group for l in s[2])
+        p95 = latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0.0
+        print(f"{len(group)} {label} clients: {min(rates):.1f}-{max(rates):.1f} fps, "
+              f"p95 latency {p95:.1f} ms")
+        if slow:
+            limit = 3 * max(slow_delay, 1.0 / fps) * 1000
+            ok = p95 <= limit
+            print(f"slow-client p95 limit {limit:.0f} ms: {'PASS' if ok else 'FAIL'}")
+    print(server.metrics.format_text())
+    print(f"Frames encoded: {server.frames_encoded} for {clients} clients, "
+          f"stale frames skipped: {server.frames_skipped}")
+    return ok
+
+
+async def serve(args):
+    metrics = StreamMetrics()
+    factory = SyntheticCapture if args.synthetic else cv2.VideoCapture
+    engine = CaptureEngine(args.device, width=args.width, height=args.height, fps=args.fps,
+                           capture_factory=factory, metrics=metrics, stream_name="server")
+    if not engine.start():
+        raise SystemExit(f"Failed to open camera {args.device}")
+
+    gate = ChangeGate(args.change_threshold, keepalive=args.keepalive) if args.change_threshold > 0 else None
+    server = StreamServer(engine, args.host, args.port,
+                          frame_protocol.CODEC_NAMES[args.codec], args.quality, metrics=metrics,
+                          adaptive=not args.fixed_quality, target_delay=args.target_delay,
+                          udp=not args.no_udp, gate=gate)
+    await server.start()
+    try:
+        await server.wait()
+    finally:
+        await server.stop()
+        engine.stop()
+        if gate is not None:
+            print(f"Change gate: {gate.summary()}")
+        if args.metrics_out:
+            export_metrics(metrics, args.metrics_out)
+            print(f"Metrics saved: {args.metrics_out}")
+
+
+def export_metrics(metrics, path):
+    """Exports metrics as CSV or JSON depending on the file extension."""
+    if path.endswith(".csv"):
+        metrics.export_csv(path)
+    else:
+        metrics.export_json(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-viewer stream server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=frame_protocol.DEFAULT_PORT)
+    parser.add_argument("--device", type=int, default=0)
+    parser.add_argument("--synthetic", action="store_true", help="serve a test pattern instead of a camera")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--codec", choices=sorted(frame_protocol.CODEC_NAMES), default="jpeg")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--fixed-quality", action="store_true",
+                        help="ignore client feedback and always send full quality")
+    parser.add_argument("--target-delay", type=float, default=0.15,
+                        help="queueing delay the adaptive controller aims to stay under, in seconds")
+    parser.add_argument("--change-threshold", type=float, default=0.005,
+                        help="fraction of a thumbnail that must change before a frame is sent; 0 sends every frame")
+    parser.add_argument("--keepalive", type=float, default=0.5,
+                        help="longest time in seconds between frames while the scene is static")
+    parser.add_argument("--no-udp", action="store_true", help="only accept TCP viewers")
+    parser.add_argument("--metrics-out", help="write stage metrics to this .json or .csv file on exit")
+    parser.add_argument("--load-test", type=int, metavar="CLIENTS",
+                        help="run simulated clients over loopback and report per-client rates")
+    parser.add_argument("--slow-clients", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    try:
+        if args.load_test:
+            ok = asyncio.run(run_load_test(args.load_test, args.slow_clients, args.duration, args.fps))
+            sys.exit(0 if ok else 1)
+        else:
+            asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
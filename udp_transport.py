@@ -0,0 +1,377 @@
+"""UDP transport for the remote stream.
+
+Over TCP one lost packet holds back every later frame until it has been
+retransmitted. Over UDP a lost datagram only costs the frame it belonged
+to. Each frame (the usual frame_protocol header followed by its payload) is
+split into datagrams that fit the link MTU, each starting with:
+
+    magic      4s   b"RVFU"
+    version    B    PROTOCOL_VERSION
+    (pad)      x
+    index      H    fragment index within the frame
+    count      H    number of fragments in the frame
+    (pad)      xx
+    frame_id   I    increases by one per frame sent to this receiver
+
+The receiver reassembles fragments, drops frames that are still incomplete
+after a deadline or that are older than the newest complete frame, and
+always hands out the newest complete frame. Receivers subscribe by sending
+a SUBSCRIBE datagram (b"RVFS", version) to the sender's port about once a
+second and may send the usual feedback reports as datagrams too.
+
+Running this module streams a test pattern over loopback through a channel
+that drops and reorders datagrams, and checks what arrives:
+
+    python udp_transport.py --loss 0.05 --reorder 0.1
+"""
+import argparse
+import random
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+import frame_protocol
+
+FRAGMENT_MAGIC = b"RVFU"
+SUBSCRIBE_MAGIC = b"RVFS"
+FRAGMENT = struct.Struct("!4sBxHHxxI")
+SUBSCRIBE = struct.Struct("!4sB")
+
+# Fits in a 1500 byte Ethernet frame with IP and UDP headers to spare
+DEFAULT_MTU = 1400
+MAX_DATAGRAM = 65535
+
+# A sender forgets receivers it has not heard from for this long
+SUBSCRIBER_TIMEOUT = 5.0
+
+
+def _newer(a, b):
+    """Returns True if frame id `a` comes after `b`, allowing for wrap-around."""
+    return a != b and ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+
+def fragment(data, frame_id, mtu=DEFAULT_MTU):
+    """Splits one frame's bytes into datagrams of at most `mtu` bytes."""
+    chunk = mtu - FRAGMENT.size
+    count = max(1, -(-len(data) // chunk))
+    if count > 0xFFFF:
+        raise frame_protocol.ProtocolError(f"Frame too large for UDP: {len(data)} bytes")
+    view = memoryview(data)
+    frame_id &= 0xFFFFFFFF
+    return [FRAGMENT.pack(FRAGMENT_MAGIC, frame_protocol.PROTOCOL_VERSION, index, count, frame_id)
+            + view[index * chunk:(index + 1) * chunk]
+            for index in range(count)]
+
+
+def send_frame(sock, address, frame, frame_id, codec=frame_protocol.CODEC_JPEG, quality=80,
+               timestamp=None, mtu=DEFAULT_MTU):
+    """Encodes `frame` and sends it to `address` as datagrams. Returns the number of bytes sent."""
+    if timestamp is None:
+        timestamp = time.time()
+    payload = frame_protocol.encode_frame(frame, codec, quality)
+    header = frame_protocol.pack_header(frame, codec, frame_id, timestamp, len(payload))
+    sent = 0
+    for datagram in fragment(header + payload, frame_id, mtu):
+        sent += sock.sendto(datagram, address)
+    return sent
+
+
+def pack_subscribe():
+    return SUBSCRIBE.pack(SUBSCRIBE_MAGIC, frame_protocol.PROTOCOL_VERSION)
+
+
+def parse_control(data):
+    """Parses a datagram sent by a receiver.
+
+    Returns a Feedback for feedback reports and None for subscriptions;
+    raises ProtocolError for anything else.
+    """
+    if len(data) == SUBSCRIBE.size:
+        magic, version = SUBSCRIBE.unpack(data)
+        if magic == SUBSCRIBE_MAGIC and version == frame_protocol.PROTOCOL_VERSION:
+            return None
+    if len(data) == frame_protocol.FEEDBACK.size:
+        return frame_protocol.unpack_feedback(data)
+    raise frame_protocol.ProtocolError("Unknown control datagram")
+
+
+class _PartialFrame:
+    __slots__ = ("first_seen", "chunks", "missing")
+
+    def __init__(self, first_seen, count):
+        self.first_seen = first_seen
+        self.chunks = [None] * count
+        self.missing = count
+
+
+class FrameReassembler:
+    """Rebuilds frames from fragments that may arrive lost, duplicated or out of order."""
+
+    def __init__(self, deadline=0.25, max_partial=16):
+        self.deadline = deadline
+        self.max_partial = max_partial
+        self.last_delivered = None
+        self.frames_completed = 0
+        self.frames_dropped = 0     # incomplete at the deadline or overtaken by a newer frame
+        self.fragments_late = 0     # arrived after their frame was delivered or given up on
+        self._partial = {}
+        self._given_up = deque(maxlen=64)  # so stragglers don't start the frame over
+
+    def add(self, datagram, now=None):
+        """Adds one datagram. Returns the frame's bytes once it is complete, otherwise None."""
+        now = time.monotonic() if now is None else now
+        if len(datagram) < FRAGMENT.size:
+            raise frame_protocol.ProtocolError("Datagram too short")
+        magic, version, index, count, frame_id = FRAGMENT.unpack_from(datagram)
+        if magic != FRAGMENT_MAGIC:
+            raise frame_protocol.ProtocolError(f"Bad fragment magic: {magic!r}")
+        if version != frame_protocol.PROTOCOL_VERSION:
+            raise frame_protocol.ProtocolError(f"Unsupported protocol version: {version}")
+        if index >= count:
+            raise frame_protocol.ProtocolError(f"Fragment {index} of {count}")
+        self.expire(now)
+
+        if ((self.last_delivered is not None and not _newer(frame_id, self.last_delivered))
+                or frame_id in self._given_up):
+            self.fragments_late += 1
+            return None
+        partial = self._partial.get(frame_id)
+        if partial is None:
+            if len(self._partial) >= self.max_partial:
+                self._drop(min(self._partial, key=lambda fid: self._partial[fid].first_seen))
+            partial = self._partial[frame_id] = _PartialFrame(now, count)
+        elif len(partial.chunks) != count:
+            raise frame_protocol.ProtocolError(f"Fragment count changed for frame {frame_id}")
+        if partial.chunks[index] is None:
+            partial.chunks[index] = bytes(datagram[FRAGMENT.size:])
+            partial.missing -= 1
+        if partial.missing:
+            return None
+
+        # Complete: anything older can never be shown any more
+        del self._partial[frame_id]
+        for other in [fid for fid in self._partial if _newer(frame_id, fid)]:
+            self._drop(other)
+        self.last_delivered = frame_id
+        self.frames_completed += 1
+        return b"".join(partial.chunks)
+
+    def expire(self, now=None):
+        """Gives up on frames that have been incomplete for longer than the deadline."""
+        now = time.monotonic() if now is None else now
+        for frame_id in [fid for fid, p in self._partial.items() if now - p.first_seen > self.deadline]:
+            self._drop(frame_id)
+
+    def _drop(self, frame_id):
+        del self._partial[frame_id]
+        self._given_up.append(frame_id)
+        self.frames_dropped += 1
+
+
+class UdpFrameReceiver:
+    """Receives frames from a UDP sender, always returning the newest complete one."""
+
+    def __init__(self, sock, sender_address, deadline=0.25, subscribe_interval=1.0):
+        self.sock = sock
+        self.sender_address = sender_address
+        self.subscribe_interval = subscribe_interval
+        self.reassembler = FrameReassembler(deadline)
+        self.frames_skipped = 0  # complete frames replaced by a newer one before being read
+        self.invalid_datagrams = 0
+        self._decoder = frame_protocol.FrameReader(None)
+        self._buffer = bytearray(MAX_DATAGRAM)
+        self._view = memoryview(self._buffer)
+        self._next_subscribe = 0.0
+
+    @property
+    def frames_lost(self):
+        """Frames that were sent but will never be returned by `read_frame`."""
+        return self.reassembler.frames_dropped + self.frames_skipped
+
+    def subscribe(self):
+        """Asks the sender to stream to this socket; repeated periodically as a keep-alive."""
+        self.sock.sendto(pack_subscribe(), self.sender_address)
+        self._next_subscribe = time.monotonic() + self.subscribe_interval
+
+    def send_feedback(self, feedback):
+        self.sock.sendto(frame_protocol.pack_feedback(feedback), self.sender_address)
+
+    def read_frame(self, timeout=1.0):
+        """Waits for a complete frame and returns (header, payload), or None after `timeout`.
+
+        Everything already queued on the socket is drained first, so the
+        frame returned is the newest one that has fully arrived.
+        """
+        give_up = time.monotonic() + timeout
+        newest = None
+        while True:
+            now = time.monotonic()
+            if now >= self._next_subscribe:
+                self.subscribe()
+            wait = 0 if newest is not None else max(0.0, min(give_up, self._next_subscribe) - now)
+            readable, _, _ = select.select([self.sock], [], [], wait)
+            if not readable:
+                if newest is not None:
+                    break
+                self.reassembler.expire()
+                if time.monotonic() >= give_up:
+                    return None
+                continue
+            size, _ = self.sock.recvfrom_into(self._buffer)
+            try:
+                data = self.reassembler.add(self._view[:size])
+            except frame_protocol.ProtocolError:
+                self.invalid_datagrams += 1
+                continue
+            if data is not None:
+                if newest is not None:
+                    self.frames_skipped += 1
+                newest = data
+
+        header = frame_protocol.unpack_header(newest[:frame_protocol.HEADER.size])
+        payload = memoryview(newest)[frame_protocol.HEADER.size:]
+        if len(payload) != header.length:
+            raise frame_protocol.ProtocolError(f"Frame {header.seq} has {len(payload)} payload bytes, "
+                                               f"expected {header.length}")
+        return header, payload
+
+    def decode(self, header, payload):
+        """Decodes a payload into a BGR ndarray; raw frames reuse one buffer."""
+        return self._decoder.decode(header, payload)
+
+
+def open_receiver(host, port=frame_protocol.DEFAULT_PORT, receive_buffer=1024 * 1024):
+    """Returns (socket, sender address) for receiving a UDP stream from `host`."""
+    address = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # Room for a few frames' worth of fragments while the receiver is busy decoding
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.bind(("0.0.0.0", 0))
+    return sock, address
+
+
+class LossyChannel:
+    """Socket stand-in that drops and reorders datagrams before sending them on."""
+
+    def __init__(self, sock, loss=0.0, reorder=0.0, seed=None):
+        self.sock = sock
+        self.loss = loss
+        self.reorder = reorder
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.dropped = 0
+        self.reordered = 0
+        self._held = []
+
+    def sendto(self, data, address):
+        self.sent += 1
+        if self.random.random() < self.loss:
+            self.dropped += 1
+            return len(data)
+        if self.random.random() < self.reorder:
+            # Hold this datagram back until after the next one
+            self.reordered += 1
+            self._held.append((bytes(data), address))
+            return len(data)
+        self.sock.sendto(data, address)
+        self.flush()
+        return len(data)
+
+    def flush(self):
+        held, self._held = self._held, []
+        for data, address in held:
+            self.sock.sendto(data, address)
+
+
+def run_loopback_test(frames=300, fps=30.0, loss=0.05, reorder=0.1, mtu=DEFAULT_MTU,
+                      codec=frame_protocol.CODEC_JPEG, quality=80, seed=1):
+    """Streams a test pattern over loopback through a LossyChannel and checks the result.
+
+    Every delivered frame must be byte-identical to the one sent and frames
+    must arrive in increasing order. Returns True if the checks pass.
+    """
+    from capture_engine import synthetic_frame
+
+    receiver_sock, _ = open_receiver("127.0.0.1", 0)
+    sender_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender_sock.bind(("127.0.0.1", 0))
+    receiver = UdpFrameReceiver(receiver_sock, sender_sock.getsockname())
+    channel = LossyChannel(sender_sock, loss, reorder, seed)
+    target = receiver_sock.getsockname()
+    target = ("127.0.0.1", target[1])
+
+    sent = {}
+    fragments = []
+
+    def send():
+        for frame_id in range(frames):
+            frame = synthetic_frame(frame_id)
+            payload = frame_protocol.encode_frame(frame, codec, quality)
+            header = frame_protocol.pack_header(frame, codec, frame_id, time.time(), len(payload))
+            sent[frame_id] = payload
+            datagrams = fragment(header + payload, frame_id, mtu)
+            fragments.append(len(datagrams))
+            for datagram in datagrams:
+                channel.sendto(datagram, target)
+            time.sleep(1.0 / fps)
+        channel.flush()
+
+    sender = threading.Thread(target=send, name="udp-test-sender", daemon=True)
+    sender.start()
+
+    delivered = []
+    corrupt = 0
+    out_of_order = 0
+    while True:
+        result = receiver.read_frame(timeout=0.5)
+        if result is None:
+            if not sender.is_alive():
+                break
+            continue
+        header, payload = result
+        if delivered and not _newer(header.seq, delivered[-1]):
+            out_of_order += 1
+        if bytes(payload) != sent.get(header.seq) or receiver.decode(header, payload) is None:
+            corrupt += 1
+        delivered.append(header.seq)
+    sender.join()
+    receiver_sock.close()
+    sender_sock.close()
+
+    mean_fragments = sum(fragments) / len(fragments)
+    expected = (1 - loss) ** mean_fragments
+    print(f"Sent {frames} frames of {mean_fragments:.1f} datagrams each; "
+          f"channel dropped {channel.dropped} and reordered {channel.reordered} "
+          f"of {channel.sent} datagrams")
+    print(f"Delivered {len(delivered)} frames ({len(delivered) / frames:.0%}, "
+          f"about {expected:.0%} expected at this loss rate); "
+          f"incomplete {receiver.reassembler.frames_dropped}, skipped {receiver.frames_skipped}, "
+          f"late fragments {receiver.reassembler.fragments_late}")
+    print(f"Corrupt frames: {corrupt}, out of order: {out_of_order}")
+    return bool(delivered) and corrupt == 0 and out_of_order == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check UDP frame transport over a lossy loopback link.")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--loss", type=float, default=0.05, help="fraction of datagrams to drop")
+    parser.add_argument("--reorder", type=float, default=0.1, help="fraction of datagrams to delay")
+    parser.add_argument("--mtu", type=int, default=DEFAULT_MTU)
+    parser.add_argument("--codec", choices=sorted(frame_protocol.CODEC_NAMES), default="jpeg")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    ok = run_loopback_test(args.frames, args.fps, args.loss, args.reorder, args.mtu,
+                           frame_protocol.CODEC_NAMES[args.codec], args.quality, args.seed)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
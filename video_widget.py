@@ -0,0 +1,96 @@
+"""Video display widget that paints BGR frames directly.
+
+`VideoWidget` wraps frames as `QImage.Format_BGR888` without a colour
+conversion, downsamples them once to the size actually shown on screen
+into a reused buffer, and repaints only when a new frame arrives or the
+widget is resized.
+"""
+import time
+
+import cv2
+import numpy as np
+from PySide6.QtCore import QRect, Qt
+from PySide6.QtGui import QImage, QPainter
+from PySide6.QtWidgets import QSizePolicy, QWidget
+
+
+class VideoWidget(QWidget):
+    """Shows BGR ndarrays scaled to fit while keeping their aspect ratio."""
+
+    def __init__(self, parent=None, metrics=None, stream_name=None):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.stream_name = stream_name
+        self.setMinimumSize(320, 240)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+        self._frame = None     # last frame handed to set_frame
+        self._scaled = None    # reused downsampling buffer
+        self._pixels = None    # array backing self._image
+        self._image = None
+
+    def _target_size(self, width, height):
+        """Returns the largest size with the frame's aspect ratio that fits the widget."""
+        ratio = self.devicePixelRatioF()
+        max_w = max(1, int(self.width() * ratio))
+        max_h = max(1, int(self.height() * ratio))
+        scale = min(max_w / width, max_h / height)
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def set_frame(self, frame):
+        """Displays a BGR frame. The frame must not be modified while it is shown."""
+        self._frame = frame
+        self._prepare_image()
+        self.update()
+
+    def clear(self):
+        self._frame = None
+        self._pixels = None
+        self._image = None
+        self.update()
+
+    def _prepare_image(self):
+        frame = self._frame
+        if frame is None:
+            return
+        started = time.perf_counter()
+        h, w = frame.shape[:2]
+        target_w, target_h = self._target_size(w, h)
+
+        if target_w < w:
+            # Downsample once to the displayed size; upscaling is left to the painter
+            if self._scaled is None or self._scaled.shape != (target_h, target_w, 3):
+                self._scaled = np.empty((target_h, target_w, 3), dtype=np.uint8)
+            cv2.resize(frame, (target_w, target_h), dst=self._scaled, interpolation=cv2.INTER_AREA)
+            pixels = self._scaled
+        else:
+            pixels = np.ascontiguousarray(frame)
+        scaled = time.perf_counter()
+
+        self._pixels = pixels
+        self._image = QImage(pixels.data, pixels.shape[1], pixels.shape[0],
+                             pixels.strides[0], QImage.Format_BGR888)
+        self._image.setDevicePixelRatio(self.devicePixelRatioF())
+        if self.metrics is not None:
+            self.metrics.record(self.stream_name, "scale", scaled - started)
+            self.metrics.record(self.stream_name, "qimage", time.perf_counter() - scaled)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._prepare_image()
+
+    def paintEvent(self, event):
+        started = time.perf_counter()
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        if self._image is not None:
+            size = self._image.deviceIndependentSize().toSize()
+            size.scale(self.size(), Qt.KeepAspectRatio)
+            target = QRect(0, 0, size.width(), size.height())
+            target.moveCenter(self.rect().center())
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.drawImage(target, self._image)
+        painter.end()
+        if self.metrics is not None and self._image is not None:
+            self.metrics.record(self.stream_name, "paint", time.perf_counter() - started)